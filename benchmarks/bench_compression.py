@@ -0,0 +1,123 @@
+"""Storage saved by compressing chat text, and what encoding and decoding cost.
+
+Run from the project root:
+
+    python -m benchmarks.bench_compression --messages 2000
+    python -m benchmarks.bench_compression --from-db --messages 5000
+
+Without --from-db the corpus is generated answers in the style of an LLM
+reply, which compress better than real ones; --from-db reads the newest
+stored answers through the configured settings instead. The dictionary is
+trained on half of the texts and measured on the other half.
+"""
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat_bot.settings')
+
+import django
+
+django.setup()
+
+from django.conf import settings
+
+from chat.compression import TextCodec, train_dictionary
+
+SENTENCES = [
+    'Python is a high-level programming language known for its readability.',
+    'It supports procedural, object-oriented and functional programming.',
+    'The standard library covers file handling, networking and data formats.',
+    'A decorator wraps a function to extend its behaviour without changing its code.',
+    'List comprehensions build a new list by applying an expression to each item.',
+    'Generators produce values lazily, which keeps memory use low for large inputs.',
+    'Virtual environments keep the dependencies of each project separate.',
+    'Django is a web framework that follows the model-template-view pattern.',
+    'The ORM maps database tables to Python classes and rows to objects.',
+    'Indexes speed up lookups at the cost of extra storage and slower writes.',
+    'Caching stores the result of expensive work so it can be reused.',
+    'Weather forecasts combine observations with numerical models of the atmosphere.',
+    'Regular exercise improves sleep, mood and long-term health.',
+    'Compound interest means the interest itself earns interest over time.',
+    'The mitochondria produce most of the energy a cell uses.',
+    'Photosynthesis turns light, water and carbon dioxide into sugar and oxygen.',
+    'Here is a short example you can adapt to your own project:',
+    'Let me know if you would like a more detailed explanation.',
+    'In summary, the best choice depends on your requirements.',
+    'There are a few things to keep in mind:',
+]
+OPENERS = ['Great question!', 'Sure!', 'Certainly.', 'Here is an overview.', 'Good question.']
+CODE = '```python\ndef greet(name):\n    return f"Hello, {name}!"\n\nprint(greet("world"))\n```'
+
+
+def generated_answer(rng):
+    parts = [rng.choice(OPENERS)]
+    for _ in range(rng.randint(1, 4)):
+        kind = rng.random()
+        if kind < 0.5:
+            parts.append(' '.join(rng.sample(SENTENCES, rng.randint(2, 5))))
+        elif kind < 0.85:
+            parts.append('\n'.join(f'* **{rng.choice(["Tip", "Note", "Step"])} {index}:** {rng.choice(SENTENCES)}' for index in range(1, rng.randint(3, 6))))
+        else:
+            parts.append(CODE)
+    parts.append(f'(answer #{rng.randint(1, 10 ** 6)})')
+    return '\n\n'.join(parts)
+
+
+def corpus(args):
+    if args.from_db:
+        from chat.models import ChatMessage
+        # Only answers are stored compressed.
+        return list(ChatMessage.objects.order_by('-id').values_list('response', flat=True)[:args.messages])
+    rng = random.Random(args.seed)
+    return [generated_answer(rng) for _ in range(args.messages)]
+
+
+def measure(codec, texts, repeat):
+    encoded = [codec.encode(text) for text in texts]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            codec.encode(text)
+    encode = (time.perf_counter() - start) / (repeat * len(texts))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for data in encoded:
+            codec.decode(data)
+    decode = (time.perf_counter() - start) / (repeat * len(texts))
+    assert [codec.decode(data) for data in encoded] == texts
+    raw_count = sum(1 for data in encoded if not data or data[0] != 0xFF)
+    return sum(len(data) for data in encoded), encode, decode, raw_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000, help='Chat exchanges to measure')
+    parser.add_argument('--from-db', action='store_true')
+    parser.add_argument('--min-length', type=int, default=settings.CHAT_COMPRESS_MIN_LENGTH)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    texts = corpus(args)
+    # Alternate answers between the two halves.
+    training = texts[::2]
+    texts = texts[1::2]
+    long_training = [text for text in training if len(text.encode()) >= args.min_length]
+    dictionary = train_dictionary(long_training)
+    raw = sum(len(text.encode()) for text in texts)
+    print(f'{len(texts)} texts, {raw / 1024:.0f} KiB raw, {len(dictionary)}-byte dictionary from {len(long_training)} texts\n')
+    print(f"{'codec':<22}{'stored KiB':>12}{'of raw':>9}{'kept raw':>10}{'encode us':>11}{'decode us':>11}")
+    codecs = [('deflate level 1', TextCodec(args.min_length, 1, use_dictionary=False))]
+    for level in (6, 9):
+        codecs.append((f'deflate level {level}', TextCodec(args.min_length, level, use_dictionary=False)))
+        codecs.append(('  + dictionary', TextCodec(args.min_length, level, dictionary=(1, dictionary))))
+    for name, codec in codecs:
+        stored, encode, decode, raw_count = measure(codec, texts, args.repeat)
+        print(f'{name:<22}{stored / 1024:>12.0f}{stored / raw:>9.1%}{raw_count / len(texts):>10.1%}'
+              f'{encode * 1e6:>11.1f}{decode * 1e6:>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Tail latency of LLM requests with and without hedging, against local Gemini stubs.
+
+Run from the project root:
+
+    python -m benchmarks.bench_hedging --requests 300 --tail-rate 0.02 --tail-latency 2
+
+Two Gemini stubs with the same long-tailed latency stand in for the primary
+and secondary models. The same requests go through a ProviderChain with
+hedging off and on; the hedged run reports how many extra upstream
+requests it cost. The hedge only helps if the slow tail is rarer than
+100 - --percentile percent of requests; otherwise the hedge delay itself lands
+in the tail.
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat_bot.settings')
+os.environ.setdefault('UPSTREAM_MAX_RETRIES', '0')
+
+import django
+
+django.setup()
+
+from benchmarks.stubs import GeminiHandler, StubConfig, handler_with
+from chat.llm import ProviderChain, parse_providers
+
+CONTENTS = [{'role': 'user', 'parts': [{'text': 'Tell me about Python.'}]}]
+
+
+class CountingConfig(StubConfig):
+    requests = 0
+
+    def delay(self):
+        CountingConfig.requests += 1
+        super().delay()
+
+
+def start_gemini(config):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_with(GeminiHandler, config))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://{}:{}'.format(*server.server_address[:2])
+
+
+def percentile(timings, percent):
+    return timings[min(len(timings) - 1, int(len(timings) * percent / 100))]
+
+
+def run(chain, requests, concurrency):
+    def one(_):
+        start = time.perf_counter()
+        chain.generate(CONTENTS)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return sorted(pool.map(one, range(requests)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--jitter', type=float, default=0.03)
+    parser.add_argument('--tail-rate', type=float, default=0.02)
+    parser.add_argument('--tail-latency', type=float, default=2.0)
+    parser.add_argument('--percentile', type=float, default=95)
+    args = parser.parse_args()
+
+    config = CountingConfig(args.latency, args.jitter, tail_rate=args.tail_rate, tail_latency=args.tail_latency)
+    entries = [f'primary@{start_gemini(config)}', f'secondary@{start_gemini(config)}']
+
+    print(f"{'mode':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'upstream/req':>14}")
+    for mode in ('single', 'hedged'):
+        providers = parse_providers(entries if mode == 'hedged' else entries[:1], '')
+        chain = ProviderChain(providers, hedge=mode == 'hedged', hedge_percentile=args.percentile, hedge_delay=1.0,
+                              min_delay=0.01, min_samples=20, max_workers=args.concurrency * 8)  # room for losing hedges
+        run(chain, 50, args.concurrency)  # warm up the latency window and connection pools
+        sent = CountingConfig.requests
+        timings = [seconds * 1000 for seconds in run(chain, args.requests, args.concurrency)]
+        time.sleep(args.tail_latency + 0.5)  # let losing hedges finish so they are counted
+        sent = CountingConfig.requests - sent
+        print(f'{mode:<12}{statistics.median(timings):>10.1f}{percentile(timings, 95):>10.1f}'
+              f'{percentile(timings, 99):>10.1f}{timings[-1]:>10.1f}{sent / args.requests:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Compare ResponseMatcher against the old two-pass scan over CUSTOM_RESPONSES.
+
+Run from the project root:
+
+    python -m benchmarks.bench_matcher --intents 5000 --messages 2000
+"""
+import argparse
+import random
+import string
+import time
+
+from chat.matcher import ResponseMatcher
+
+
+def linear_match(responses, message):
+    for question, answer in responses.items():
+        if message == question:
+            return answer
+    for question, answer in responses.items():
+        if question in message:
+            return answer
+    return None
+
+
+def random_phrase(rng, words):
+    return ' '.join(rng.choice(words) for _ in range(rng.randint(2, 4)))
+
+
+def build_corpus(intents, messages, seed):
+    rng = random.Random(seed)
+    words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 8))) for _ in range(intents)]
+    responses = {}
+    while len(responses) < intents:
+        responses[random_phrase(rng, words)] = f'answer {len(responses)}'
+    questions = list(responses)
+    samples = []
+    for _ in range(messages):
+        roll = rng.random()
+        if roll < 0.2:
+            samples.append(rng.choice(questions))
+        elif roll < 0.5:
+            samples.append(f'{random_phrase(rng, words)} {rng.choice(questions)} {random_phrase(rng, words)}')
+        else:
+            samples.append(' '.join(rng.choice(words) for _ in range(rng.randint(4, 20))))
+    return responses, samples
+
+
+def timed(func, samples):
+    start = time.perf_counter()
+    results = [func(sample) for sample in samples]
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--intents', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    responses, samples = build_corpus(args.intents, args.messages, args.seed)
+
+    start = time.perf_counter()
+    matcher = ResponseMatcher(responses)
+    build_time = time.perf_counter() - start
+
+    linear_time, expected = timed(lambda m: linear_match(responses, m), samples)
+    matcher_time, actual = timed(matcher.match, samples)
+    if expected != actual:
+        raise SystemExit('ResponseMatcher disagrees with the linear scan')
+
+    per_msg = lambda total: total / len(samples) * 1e6
+    print(f'intents={len(responses)} messages={len(samples)} hits={sum(r is not None for r in actual)}')
+    print(f'build          {build_time * 1000:10.2f} ms')
+    print(f'linear scan    {per_msg(linear_time):10.2f} us/msg')
+    print(f'matcher        {per_msg(matcher_time):10.2f} us/msg')
+    print(f'speedup        {linear_time / matcher_time:10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
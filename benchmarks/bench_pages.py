@@ -0,0 +1,62 @@
+"""Cost of serving the landing and chat pages with and without the page cache.
+
+Run from the project root:
+
+    python -m benchmarks.bench_pages --requests 2000
+
+Each mode runs in a fresh interpreter through Django's test client, so the
+numbers include the middleware stack but no network. "revalidate" sends the
+ETag from the first response back in If-None-Match and gets 304s.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+PAGES = '''
+import json, sys, time
+import django
+django.setup()
+from django.contrib.auth.models import User
+from django.test import Client
+path, requests, revalidate = sys.argv[1], int(sys.argv[2]), sys.argv[3] == '1'
+client = Client()
+if path == '/chat/':
+    user, _ = User.objects.get_or_create(username='bench-pages')
+    client.force_login(user)
+first = client.get(path, HTTP_ACCEPT_ENCODING='gzip, br')
+headers = {'HTTP_ACCEPT_ENCODING': 'gzip, br'}
+if revalidate:
+    headers['HTTP_IF_NONE_MATCH'] = first['ETag']
+start = time.perf_counter()
+for _ in range(requests):
+    response = client.get(path, **headers)
+print(json.dumps({'seconds': time.perf_counter() - start, 'status': response.status_code, 'bytes': len(response.content)}))
+'''
+
+
+def run_child(args, env):
+    env = {'DJANGO_SETTINGS_MODULE': 'chat_bot.settings', **os.environ, **env}
+    result = subprocess.run([sys.executable, '-W', 'ignore', '-c', PAGES, *args], cwd=BASE_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'page':<10}{'mode':<12}{'us/request':>12}{'status':>8}{'bytes':>8}")
+    for path in ('/', '/chat/'):
+        for mode, enabled, revalidate in (('render', 'False', '0'), ('cached', 'True', '0'), ('revalidate', 'True', '1')):
+            result = run_child([path, str(args.requests), revalidate], {'PAGE_CACHE_ENABLED': enabled})
+            print(f"{path:<10}{mode:<12}{result['seconds'] * 1e6 / args.requests:>12.0f}{result['status']:>8}{result['bytes']:>8}")
+
+
+if __name__ == '__main__':
+    main()
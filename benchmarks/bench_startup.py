@@ -0,0 +1,95 @@
+"""Cold-start and connection-reuse timings for the Django app.
+
+Run from the project root:
+
+    python -m benchmarks.bench_startup --runs 5 --requests 200
+
+Each cold start is a fresh interpreter that loads the WSGI application and
+serves its first request, as a Render instance does after a deploy or a
+spin-down; it is timed as is and again with the Gemini SDK imported eagerly,
+which is what chat.views used to do. The connection test serves
+--requests history requests with DB_CONN_MAX_AGE=0 and with reuse enabled,
+counting new database connections; it needs a migrated database and
+creates a bench-startup user. Set the DB_* variables to measure against
+MySQL; without them both runs use the local SQLite profile.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+COLD_START = '''
+import json, sys, time
+start = time.perf_counter()
+if sys.argv[1] == 'eager-sdk':
+    import google.generativeai
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.test import Client
+Client().get('/login/')
+print(json.dumps({'seconds': time.perf_counter() - start}))
+'''
+
+CONNECTIONS = '''
+import json, sys, time
+import django
+django.setup()
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+user, _ = User.objects.get_or_create(username='bench-startup')
+client = Client()
+client.force_login(user)
+connections.close_all()
+opened = [0]
+connection_created.connect(lambda **kwargs: opened.__setitem__(0, opened[0] + 1), weak=False)
+start = time.perf_counter()
+for _ in range(int(sys.argv[1])):
+    # The test client skips the request_started/finished connection
+    # handling, so apply CONN_MAX_AGE the way a real request would.
+    close_old_connections()
+    client.get('/chat-history/', {'limit': 10})
+    close_old_connections()
+print(json.dumps({'seconds': time.perf_counter() - start, 'connections': opened[0]}))
+'''
+
+
+def run_child(script, args, env):
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'chat_bot.settings', **env}
+    result = subprocess.run([sys.executable, '-W', 'ignore', '-c', script, *args], cwd=BASE_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def sdk_installed():
+    return subprocess.run([sys.executable, '-c', 'import google.generativeai'], capture_output=True).returncode == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--conn-max-age', default='60', help='DB_CONN_MAX_AGE for the reuse run')
+    args = parser.parse_args()
+
+    print(f"{'cold start':<24}{'median ms':>12}{'min ms':>10}")
+    modes = ['lazy'] + (['eager-sdk'] if sdk_installed() else [])
+    for mode in modes:
+        timings = [run_child(COLD_START, [mode], {})['seconds'] * 1000 for _ in range(args.runs)]
+        print(f'{mode:<24}{statistics.median(timings):>12.1f}{min(timings):>10.1f}')
+
+    print(f"\n{'DB_CONN_MAX_AGE':<24}{'ms/request':>12}{'connections':>13}")
+    for max_age in ('0', args.conn_max_age):
+        result = run_child(CONNECTIONS, [str(args.requests)], {'DB_CONN_MAX_AGE': max_age})
+        print(f"{max_age:<24}{result['seconds'] * 1000 / args.requests:>12.2f}{result['connections']:>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""Load driver for the chat hot paths with latency percentiles per endpoint.
+
+Against a running server:
+
+    python -m benchmarks.loadtest --base-url http://127.0.0.1:8000 \\
+        --username bench --password bench-pass-123
+
+Or let the driver start the stubs and the app itself, once per mode:
+
+    python -m benchmarks.loadtest --server wsgi --server asgi --create-user
+
+The app is started with the current environment plus the stub settings,
+so run it against a disposable database. Rate limiting is switched off
+there unless --rate-limits is given; against a running server, start it
+with RATELIMIT_ENABLED=False or most requests measure 429s. Use --json to
+append one result line per run, which makes it easy to compare commits.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import requests
+
+from benchmarks.stubs import StubConfig, start_stubs, stub_environment
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+PROMPTS = [
+    'hello',
+    'what is python',
+    'explain recursion with an example',
+    'weather in london',
+    'what is the temperature in paris',
+    'write a haiku about databases',
+    'how do I reverse a list',
+    'thank you',
+]
+
+SERVER_COMMANDS = {
+    'wsgi': ['gunicorn', 'chat_bot.wsgi:application', '--workers', '2', '--threads', '8', '--bind', '127.0.0.1:{port}'],
+    'asgi': ['uvicorn', 'chat_bot.asgi:application', '--workers', '2', '--host', '127.0.0.1', '--port', '{port}'],
+}
+
+
+def post_chat(session, base_url):
+    return session.post(f'{base_url}/api/', json={'message': random.choice(PROMPTS)}, timeout=60)
+
+
+def post_stream(session, base_url):
+    response = session.post(f'{base_url}/api/stream/', json={'message': random.choice(PROMPTS)}, stream=True, timeout=60)
+    for _ in response.iter_content(chunk_size=None):
+        pass
+    return response
+
+
+def get_history(session, base_url):
+    return session.get(f'{base_url}/chat-history/', params={'limit': 50}, timeout=60)
+
+
+def post_otp(session, base_url):
+    return session.post(f'{base_url}/resend-otp-password/', json={'email': 'bench@example.com'}, timeout=60)
+
+
+ENDPOINTS = {
+    'chat': post_chat,
+    'stream': post_stream,
+    'history': get_history,
+    'otp': post_otp,
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def login(base_url, username, password):
+    session = requests.Session()
+    response = session.post(f'{base_url}/login/', data={'username': username, 'password': password},
+                            headers={'X-Requested-With': 'XMLHttpRequest'}, timeout=30)
+    if not response.ok or not response.json().get('success'):
+        raise SystemExit(f'Login as {username!r} failed: {response.status_code} {response.text[:200]}')
+    return session
+
+
+def run_load(base_url, username, password, endpoints, concurrency, duration):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        session = login(base_url, username, password)
+        while time.perf_counter() < deadline:
+            name = random.choice(endpoints)
+            start = time.perf_counter()
+            try:
+                ok = ENDPOINTS[name](session, base_url).status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[name].append(elapsed)
+                if not ok:
+                    errors[name] += 1
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    report = {}
+    for name in endpoints:
+        values = sorted(latencies[name])
+        report[name] = {
+            'requests': len(values),
+            'errors': errors[name],
+            'rps': len(values) / wall if wall else 0.0,
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+        }
+    return report
+
+
+def print_report(mode, report):
+    print(f'\n[{mode}]')
+    print(f"{'endpoint':<10}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in report.items():
+        print(f"{name:<10}{row['requests']:>10}{row['errors']:>8}{row['rps']:>10.1f}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+
+
+def wait_for(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise SystemExit(f'Server at {url} did not come up within {timeout}s')
+
+
+def create_user(env, username, password):
+    script = (
+        'from django.contrib.auth.models import User\n'
+        f'user = User.objects.filter(username={username!r}).first() or User(username={username!r}, email="bench@example.com")\n'
+        f'user.set_password({password!r})\n'
+        'user.save()\n'
+    )
+    subprocess.run([sys.executable, 'manage.py', 'shell', '-c', script], cwd=BASE_DIR, env=env, check=True)
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--server', action='append', choices=sorted(SERVER_COMMANDS), help='Start the app in this mode (repeatable)')
+    parser.add_argument('--port', type=int, default=8010)
+    parser.add_argument('--username', default='bench')
+    parser.add_argument('--password', default='bench-pass-123')
+    parser.add_argument('--create-user', action='store_true')
+    parser.add_argument('--endpoints', default='chat,stream,history,otp')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--latency', type=float, default=0.3, help='Stub upstream latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Stub upstream error rate')
+    parser.add_argument('--json', type=Path, help='Append results to this JSON-lines file')
+    parser.add_argument('--rate-limits', action='store_true', help='Keep the per-user rate limits on in the started app')
+    args = parser.parse_args()
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+
+    results = {}
+    if not args.server:
+        results['external'] = run_load(args.base_url, args.username, args.password, endpoints, args.concurrency, args.duration)
+        print_report('external', results['external'])
+    else:
+        config = StubConfig(args.latency, args.latency / 5, args.error_rate)
+        servers = start_stubs(gemini_config=config, weather_config=config)
+        env = {**os.environ, **stub_environment(servers), 'MAIL_QUEUE_POLL_INTERVAL': '0.5'}
+        if args.rate_limits:
+            env['RATELIMIT_ENABLED'] = 'True'
+        if args.create_user:
+            create_user(env, args.username, args.password)
+        base_url = f'http://127.0.0.1:{args.port}'
+        for mode in args.server:
+            command = [part.format(port=args.port) for part in SERVER_COMMANDS[mode]]
+            process = subprocess.Popen(command, cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_for(f'{base_url}/login/')
+                results[mode] = run_load(base_url, args.username, args.password, endpoints, args.concurrency, args.duration)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+            print_report(mode, results[mode])
+        print(f"\nsmtp sink received {servers['smtp'].delivered} messages")
+
+    if args.json:
+        record = {'commit': current_commit(), 'time': time.time(), 'concurrency': args.concurrency, 'results': results}
+        with open(args.json, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""Local stand-ins for Gemini, OpenWeather and SMTP.
+
+Run from the project root:
+
+    python -m benchmarks.stubs --latency 0.3 --error-rate 0.02
+
+then point the app at them with GEMINI_API_BASE, OPENWEATHER_API_BASE,
+EMAIL_HOST/EMAIL_PORT (and EMAIL_USE_TLS=False).
+"""
+import argparse
+import json
+import random
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+LOREM = (
+    'Python is a high-level programming language known for its readability. '
+    'It supports several programming paradigms and ships with a large standard library. '
+    'Many teams use it for web development, automation and data analysis.'
+).split(' ')
+
+
+class StubConfig:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, token_delay=0.02, tokens=40, tail_rate=0.0, tail_latency=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+
+    def delay(self):
+        # tail_rate of the requests are tail_latency seconds slower, for a long tail.
+        tail = self.tail_latency if random.random() < self.tail_rate else 0.0
+        time.sleep(max(0.0, self.latency + tail + random.uniform(-self.jitter, self.jitter)))
+
+    def should_fail(self):
+        return random.random() < self.error_rate
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = StubConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client hung up, e.g. a cancelled hedge
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_status(self):
+        self.send_json(random.choice([429, 500, 503]), {'error': {'message': 'stub failure'}})
+
+
+class GeminiHandler(StubHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        path = urlparse(self.path).path
+        self.config.delay()
+        if self.config.should_fail():
+            return self.send_error_status()
+        words = [random.choice(LOREM) for _ in range(self.config.tokens)]
+        if path.endswith(':streamGenerateContent'):
+            return self.stream(words)
+        if path.endswith(':generateContent'):
+            return self.send_json(200, candidate(' '.join(words)))
+        self.send_json(404, {'error': {'message': 'unknown method'}})
+
+    def stream(self, words):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for start in range(0, len(words), 4):
+            time.sleep(self.config.token_delay)
+            event = f'data: {json.dumps(candidate(" ".join(words[start:start + 4]) + " "))}\r\n\r\n'.encode()
+            self.wfile.write(f'{len(event):x}\r\n'.encode() + event + b'\r\n')
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+
+def candidate(text):
+    return {'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}}]}
+
+
+class OpenWeatherHandler(StubHandler):
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        city = query.get('q', [''])[0]
+        self.config.delay()
+        if self.config.should_fail():
+            return self.send_error_status()
+        if city.lower() in ('atlantis', 'nowhere'):
+            return self.send_json(404, {'cod': '404', 'message': 'city not found'})
+        self.send_json(200, {
+            'cod': 200,
+            'name': city,
+            'weather': [{'description': random.choice(['clear sky', 'light rain', 'scattered clouds'])}],
+            'main': {'temp': round(random.uniform(-5, 35), 1), 'humidity': random.randint(20, 95)},
+            'wind': {'speed': round(random.uniform(0, 12), 1)},
+        })
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Accepts and discards mail, counting messages on the server."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 smtp-sink ready')
+        in_data = False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if in_data:
+                if line.rstrip(b'\r\n') == b'.':
+                    in_data = False
+                    self.server.delivered += 1
+                    self.server.config.delay()
+                    self.reply('250 OK queued')
+                continue
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith('EHLO'):
+                self.reply('250-smtp-sink')
+                self.reply('250 SIZE 10485760')
+            elif command.startswith(('HELO', 'MAIL', 'RCPT', 'RSET', 'NOOP')):
+                self.reply('250 OK')
+            elif command.startswith('DATA'):
+                in_data = True
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command.startswith('QUIT'):
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, config):
+        super().__init__(address, SMTPSinkHandler)
+        self.config = config
+        self.delivered = 0
+
+
+def handler_with(handler, config):
+    return type(handler.__name__, (handler,), {'config': config})
+
+
+def start_stubs(host='127.0.0.1', gemini_port=0, weather_port=0, smtp_port=0,
+                gemini_config=None, weather_config=None, smtp_config=None):
+    """Start all three stubs on background threads and return the servers."""
+    servers = {
+        'gemini': ThreadingHTTPServer((host, gemini_port), handler_with(GeminiHandler, gemini_config or StubConfig())),
+        'openweather': ThreadingHTTPServer((host, weather_port), handler_with(OpenWeatherHandler, weather_config or StubConfig())),
+        'smtp': SMTPSink((host, smtp_port), smtp_config or StubConfig()),
+    }
+    for name, server in servers.items():
+        threading.Thread(target=server.serve_forever, name=f'{name}-stub', daemon=True).start()
+    return servers
+
+
+def stub_environment(servers):
+    """Environment variables that point the app at running stubs."""
+    host = lambda name: '{}:{}'.format(*servers[name].server_address[:2])
+    return {
+        'GEMINI_API_BASE': f"http://{host('gemini')}",
+        'OPENWEATHER_API_BASE': f"http://{host('openweather')}",
+        'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+        'EMAIL_HOST': servers['smtp'].server_address[0],
+        'EMAIL_PORT': str(servers['smtp'].server_address[1]),
+        'EMAIL_USE_TLS': 'False',
+        'EMAIL_HOST_USER': '',
+        'EMAIL_HOST_PASSWORD': '',
+        'DEFAULT_FROM_EMAIL': 'chatbot@example.com',
+        'CONTACT_EMAIL': 'contact@example.com',
+        # The per-user limits (20 chats a minute, 5 OTPs per 10 minutes) would
+        # turn most of a single benchmark user's requests into 429s.
+        'RATELIMIT_ENABLED': 'False',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--gemini-port', type=int, default=8701)
+    parser.add_argument('--weather-port', type=int, default=8702)
+    parser.add_argument('--smtp-port', type=int, default=8725)
+    parser.add_argument('--latency', type=float, default=0.2, help='Base upstream latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--token-delay', type=float, default=0.02, help='Delay between streamed chunks')
+    parser.add_argument('--tail-rate', type=float, default=0.0, help='Fraction of requests that are slow')
+    parser.add_argument('--tail-latency', type=float, default=0.0, help='Extra seconds added to slow requests')
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.jitter, args.error_rate, args.token_delay,
+                        tail_rate=args.tail_rate, tail_latency=args.tail_latency)
+    servers = start_stubs(args.host, args.gemini_port, args.weather_port, args.smtp_port, config, config, StubConfig())
+    for name, value in stub_environment(servers).items():
+        print(f'{name}={value}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
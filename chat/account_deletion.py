@@ -0,0 +1,147 @@
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import OTP, AccountDeletion, ArchivedChatMessage, ChatMessage, Conversation
+
+logger = logging.getLogger(__name__)
+
+# Progress field -> table purged, in dependency order.
+PURGE_TABLES = (
+    ('messages_deleted', ChatMessage),
+    ('archived_deleted', ArchivedChatMessage),
+    ('conversations_deleted', Conversation),
+)
+
+
+def delete_chunk(model, user_id, chunk_size):
+    """Delete up to ``chunk_size`` of the user's rows without loading them.
+
+    QuerySet.delete() fetches every row to run the cascade collector, which
+    is what made deleting a large account time out.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    if connection.vendor == 'mysql':
+        sql = f'DELETE FROM {table} WHERE user_id = %s LIMIT %s'
+    else:
+        sql = f'DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE user_id = %s LIMIT %s)'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, chunk_size])
+        return cursor.rowcount
+
+
+def purge_account(job, chunk_size, lease):
+    for field, model in PURGE_TABLES:
+        while True:
+            deleted = delete_chunk(model, job.user_id, chunk_size)
+            if not deleted:
+                break
+            setattr(job, field, getattr(job, field) + deleted)
+            # Saving progress also renews the lease on long purges.
+            job.next_attempt_at = timezone.now() + lease
+            job.save(update_fields=[field, 'next_attempt_at', 'updated_at'])
+    if job.email:
+        OTP.objects.filter(email=job.email).delete()
+    User.objects.filter(id=job.user_id).delete()
+    job.status = AccountDeletion.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at', 'updated_at'])
+
+
+def claim_job(lease):
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            AccountDeletion.objects.select_for_update(skip_locked=True)
+            .filter(status=AccountDeletion.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .first()
+        )
+        if job is not None:
+            job.next_attempt_at = now + lease
+            job.save(update_fields=['next_attempt_at', 'updated_at'])
+    return job
+
+
+def process_once(chunk_size=None):
+    chunk_size = chunk_size or settings.ACCOUNT_DELETION_CHUNK_SIZE
+    lease = timedelta(seconds=settings.ACCOUNT_DELETION_LEASE)
+    job = claim_job(lease)
+    if job is None:
+        return 0
+    try:
+        purge_account(job, chunk_size, lease)
+    except Exception as e:
+        job.attempts += 1
+        job.last_error = str(e)
+        if job.attempts >= settings.ACCOUNT_DELETION_MAX_ATTEMPTS:
+            job.status = AccountDeletion.FAILED
+        else:
+            job.next_attempt_at = timezone.now() + timedelta(seconds=settings.ACCOUNT_DELETION_RETRY_DELAY) * 2 ** (job.attempts - 1)
+        job.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at', 'updated_at'])
+        logger.warning('Deleting account %s failed (attempt %d): %s', job.user_id, job.attempts, e)
+    return 1
+
+
+class AccountDeletionWorker:
+    """Daemon thread that works through pending AccountDeletion jobs."""
+
+    def __init__(self, poll_interval=30.0):
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name='account-deletion', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def wake(self):
+        self.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            try:
+                processed = process_once()
+            except Exception:
+                logger.exception('Account deletion worker failed')
+                processed = 0
+            finally:
+                close_old_connections()
+            if not processed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+
+worker = AccountDeletionWorker(settings.ACCOUNT_DELETION_POLL_INTERVAL)
+
+
+def schedule_deletion(user):
+    """Deactivate ``user`` now and queue the removal of their data."""
+    with transaction.atomic():
+        User.objects.filter(id=user.id).update(is_active=False)
+        job, created = AccountDeletion.objects.get_or_create(
+            user_id=user.id,
+            defaults={'username': user.username, 'email': user.email},
+        )
+        if not created and job.status == AccountDeletion.FAILED:
+            job.status = AccountDeletion.PENDING
+            job.attempts = 0
+            job.next_attempt_at = timezone.now()
+            job.save(update_fields=['status', 'attempts', 'next_attempt_at', 'updated_at'])
+        if settings.ACCOUNT_DELETION_MODE == 'thread':
+            transaction.on_commit(worker.wake)
+    return job
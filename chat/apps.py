@@ -1,6 +1,34 @@
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def start_workers(**kwargs):
+    # Started with the first request of each process rather than in ready(),
+    # which also runs for migrate and every other management command. This
+    # picks up rows left pending or backed off before a restart.
+    from .account_deletion import worker
+    from .mail_queue import dispatcher
+
+    if settings.MAIL_QUEUE_MODE == 'thread':
+        dispatcher.start()
+    if settings.ACCOUNT_DELETION_MODE == 'thread':
+        worker.start()
 
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.signals import user_logged_out
+        from django.core.signals import request_started
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_save
+
+        from . import metrics, user_cache
+
+        connection_created.connect(metrics.install_query_counter)
+        post_save.connect(user_cache.user_saved, sender=get_user_model(), dispatch_uid='chat.user_saved')
+        user_logged_out.connect(user_cache.user_logged_out, dispatch_uid='chat.user_logged_out')
+        request_started.connect(start_workers, dispatch_uid='chat.start_workers')
@@ -0,0 +1,23 @@
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class BoundedLocMemCache(LocMemCache):
+    """LocMemCache that caps every entry at OPTIONS['MAX_TIMEOUT'] seconds.
+
+    Meant for per-process copies of data the database owns, such as cached_db
+    sessions: callers may ask for weeks, but a logout handled by another
+    worker must become visible here within MAX_TIMEOUT.
+    """
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self.max_timeout = params.get('OPTIONS', {}).get('MAX_TIMEOUT', 60)
+
+    def get_backend_timeout(self, timeout=DEFAULT_TIMEOUT):
+        # The base class returns an absolute expiry time, or None for never.
+        expires = super().get_backend_timeout(timeout)
+        latest = time.time() + self.max_timeout
+        return latest if expires is None else min(expires, latest)
@@ -0,0 +1,161 @@
+import threading
+import zlib
+from collections import Counter
+
+from django import forms
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, models
+from django.db.models import ExpressionWrapper, F
+
+# Compressed values start with a byte that never begins UTF-8 text, then the
+# format and the id of the dictionary they were deflated with (0 for none).
+# Anything else is the raw UTF-8 text.
+MAGIC = 0xFF
+DEFLATE = 1
+HEADER_SIZE = 3
+WINDOW_SIZE = 32 * 1024
+
+
+class TextCodec:
+    """Deflates text of ``min_length`` bytes or more, with the newest trained dictionary.
+
+    Dictionaries live in CompressionDictionary and are loaded once per
+    process; workers pick up a newly trained one when they restart. An
+    ``(id, data)`` ``dictionary`` is used instead of the stored ones.
+    """
+
+    def __init__(self, min_length=200, level=6, use_dictionary=True, dictionary=None):
+        self.min_length = min_length
+        self.level = level
+        self.use_dictionary = use_dictionary
+        self._dictionaries = dict([dictionary]) if dictionary else {}
+        self._current = dictionary
+        self._lock = threading.Lock()
+
+    def dictionary(self, dictionary_id):
+        zdict = self._dictionaries.get(dictionary_id)
+        if zdict is None:
+            model = apps.get_model('chat', 'CompressionDictionary')
+            zdict = bytes(model.objects.values_list('data', flat=True).get(id=dictionary_id))
+            with self._lock:
+                self._dictionaries[dictionary_id] = zdict
+        return zdict
+
+    def current(self):
+        """The (id, data) of the dictionary new values are deflated with, or (0, None)."""
+        if not self.use_dictionary:
+            return 0, None
+        if self._current is None:
+            model = apps.get_model('chat', 'CompressionDictionary')
+            try:
+                latest = model.objects.order_by('-id').values_list('id', 'data').first()
+            except DatabaseError:
+                return 0, None  # not migrated yet
+            current = (latest[0], bytes(latest[1])) if latest else (0, None)
+            with self._lock:
+                self._current = current
+                if latest:
+                    self._dictionaries[current[0]] = current[1]
+        return self._current
+
+    def refresh(self):
+        with self._lock:
+            self._current = None
+
+    def encode(self, text):
+        data = text.encode()
+        if len(data) < self.min_length:
+            return data
+        dictionary_id, zdict = self.current()
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15, **({'zdict': zdict} if zdict else {}))
+        packed = bytes((MAGIC, DEFLATE, dictionary_id)) + compressor.compress(data) + compressor.flush()
+        return packed if len(packed) < len(data) else data
+
+    def decode(self, data):
+        if isinstance(data, str):
+            return data
+        data = bytes(data)
+        if not data or data[0] != MAGIC:
+            return data.decode()
+        if data[1] != DEFLATE:
+            raise ValueError(f'Unknown compressed text format {data[1]}')
+        zdict = self.dictionary(data[2]) if data[2] else None
+        decompressor = zlib.decompressobj(-15, **({'zdict': zdict} if zdict else {}))
+        return (decompressor.decompress(data[HEADER_SIZE:]) + decompressor.flush()).decode()
+
+
+codec = TextCodec(settings.CHAT_COMPRESS_MIN_LENGTH, settings.CHAT_COMPRESS_LEVEL, settings.CHAT_COMPRESS_DICTIONARY)
+
+
+def train_dictionary(samples, size=WINDOW_SIZE, max_words=4):
+    """Build a zlib preset dictionary from the phrases repeated most across ``samples``.
+
+    zlib has no trainer, so this picks the word n-grams that save the most
+    bytes (occurrences times length) until ``size`` bytes are used. The best
+    go last, as deflate reaches recent dictionary bytes with shorter codes.
+    """
+    counts = Counter()
+    for text in samples:
+        words = text.split(' ')
+        for n in range(1, max_words + 1):
+            for start in range(len(words) - n + 1):
+                counts[' '.join(words[start:start + n])] += 1
+    phrases, used = [], 0
+    for phrase, count in sorted(counts.items(), key=lambda item: (item[1] - 1) * len(item[0]), reverse=True):
+        if count < 2 or len(phrase) < 4:
+            continue
+        encoded = phrase.encode()
+        if used + len(encoded) + 1 > size:
+            break
+        phrases.append(encoded)
+        used += len(encoded) + 1
+    return b' '.join(reversed(phrases))
+
+
+class CompressedTextField(models.BinaryField):
+    """Text column stored as bytes, deflated by ``codec`` once it is long enough.
+
+    Reads return str. Use raw_text() to select the stored bytes instead and
+    decode only the rows that are used.
+    """
+
+    description = 'Text, compressed when long'
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.editable:
+            del kwargs['editable']
+        else:
+            kwargs['editable'] = False
+        return name, path, args, kwargs
+
+    def get_default(self):
+        return models.Field.get_default(self)
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else codec.decode(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return codec.decode(value)
+        return value
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        return codec.encode(value) if isinstance(value, str) else value
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{'widget': forms.Textarea, **kwargs})
+
+
+def raw_text(field_name):
+    """Select a CompressedTextField as its stored bytes, for codec.decode() later."""
+    return ExpressionWrapper(F(field_name), output_field=models.BinaryField())
@@ -0,0 +1,117 @@
+import re
+
+from django.core.cache import caches
+
+from .models import ChatMessage, Conversation
+from .write_buffer import chat_buffer
+
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s')
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text; close enough to
+    # keep requests inside the budget without shipping a tokenizer.
+    return len(text) // 4 + 1
+
+
+def first_sentence(text, limit=200):
+    sentence = SENTENCE_END_RE.split(' '.join(text.split()), 1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit].rstrip() + '...'
+
+
+def user_part(text):
+    return {'role': 'user', 'parts': [{'text': text}]}
+
+
+def model_part(text):
+    return {'role': 'model', 'parts': [{'text': text}]}
+
+
+class ContextBuilder:
+    """Assembles Gemini multi-turn ``contents`` for a conversation.
+
+    The last ``max_turns`` exchanges are kept verbatim in a window, cached
+    for ``cache_ttl`` seconds or read from the database on every turn when
+    that is 0; exchanges that fall out of it are folded one at a time into
+    ``Conversation.summary``, which is trimmed from the front to stay under
+    ``summary_max_tokens``. ``build`` then fits the summary and the newest
+    turns into ``token_budget``. Replies in ``exclude_responses`` (canned
+    error messages) never enter the window.
+    """
+
+    def __init__(self, max_turns=10, token_budget=3000, summary_max_tokens=400, cache_ttl=3600, cache_alias='default', exclude_responses=()):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_max_tokens = summary_max_tokens
+        self.cache_ttl = cache_ttl
+        self.cache_alias = cache_alias
+        self.exclude_responses = set(exclude_responses)
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def key(self, conversation_id):
+        return f'conversation:{conversation_id}:window'
+
+    def load(self, conversation):
+        rows = ChatMessage.objects.filter(conversation=conversation).order_by('-id').values_list('timestamp', 'message', 'response')[:self.max_turns]
+        turns = {(timestamp, message): response for timestamp, message, response in rows}
+        # Turns still in the write-behind buffer; a row can briefly be in both.
+        for record in chat_buffer.pending_for(conversation.user_id):
+            if record['conversation_id'] == conversation.id:
+                turns.setdefault((record['timestamp'], record['message']), record['response'])
+        turns = [[message, response] for (_, message), response in sorted(turns.items(), key=lambda item: item[0][0]) if response not in self.exclude_responses]
+        return {'summary': conversation.summary, 'turns': turns[-self.max_turns:]}
+
+    def window(self, conversation):
+        if not self.cache_ttl:
+            return self.load(conversation)
+        window = self.cache.get(self.key(conversation.id))
+        if window is None:
+            window = self.load(conversation)
+            self.cache.set(self.key(conversation.id), window, self.cache_ttl)
+        return window
+
+    def build(self, conversation, message):
+        window = self.window(conversation)
+        summary = window['summary']
+        budget = self.token_budget - estimate_tokens(message)
+        if summary:
+            budget -= estimate_tokens(summary)
+        selected = []
+        for user_text, model_text in reversed(window['turns']):
+            cost = estimate_tokens(user_text) + estimate_tokens(model_text)
+            if cost > budget:
+                break
+            budget -= cost
+            selected.append((user_text, model_text))
+        contents = []
+        if summary:
+            contents.append(user_part(f'Summary of our conversation so far: {summary}'))
+            contents.append(model_part('Understood.'))
+        for user_text, model_text in reversed(selected):
+            contents.append(user_part(user_text))
+            contents.append(model_part(model_text))
+        contents.append(user_part(message))
+        return contents
+
+    def summarize(self, summary, user_text, model_text):
+        line = f'User asked: {first_sentence(user_text)} Assistant replied: {first_sentence(model_text)}'
+        lines = [item for item in summary.split('\n') if item] + [line]
+        while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > self.summary_max_tokens:
+            lines.pop(0)
+        return '\n'.join(lines)
+
+    def record(self, conversation, message, response):
+        if response in self.exclude_responses:
+            return
+        window = self.window(conversation)
+        window['turns'].append([message, response])
+        if len(window['turns']) > self.max_turns:
+            for user_text, model_text in window['turns'][:-self.max_turns]:
+                window['summary'] = self.summarize(window['summary'], user_text, model_text)
+            window['turns'] = window['turns'][-self.max_turns:]
+            Conversation.objects.filter(id=conversation.id).update(summary=window['summary'])
+        if self.cache_ttl:
+            self.cache.set(self.key(conversation.id), window, self.cache_ttl)
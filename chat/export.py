@@ -0,0 +1,121 @@
+import csv
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+
+from .models import ArchivedChatMessage, ChatMessage
+from .write_buffer import chat_buffer
+
+EXPORT_FIELDS = ('id', 'conversation_id', 'timestamp', 'message', 'response')
+CHUNK_BYTES = 64 * 1024
+
+
+def iter_messages(user_id, chunk_size=1000):
+    """Yield all of a user's messages, oldest first, ``chunk_size`` rows per query.
+
+    Batches are fetched by keyset on id rather than with QuerySet.iterator():
+    mysqlclient buffers a whole result set client-side, so only small
+    queries keep memory flat on MySQL.
+    """
+    for model, fields in (
+        (ArchivedChatMessage, ('id', 'timestamp', 'message', 'response')),
+        (ChatMessage, ('id', 'conversation_id', 'timestamp', 'message', 'response')),
+    ):
+        last_id = 0
+        while True:
+            rows = list(model.objects.filter(user_id=user_id, id__gt=last_id).order_by('id').values(*fields)[:chunk_size])
+            for row in rows:
+                row.setdefault('conversation_id', None)
+                yield row
+            if len(rows) < chunk_size:
+                break
+            last_id = rows[-1]['id']
+    pending = chat_buffer.pending_for(user_id)
+    if pending:
+        # A batch being flushed can already be in the table read above.
+        stored = set(
+            ChatMessage.objects.filter(user_id=user_id, timestamp__gte=pending[0]['timestamp'])
+            .values_list('timestamp', 'message')
+        )
+        for record in pending:
+            if (record['timestamp'], record['message']) not in stored:
+                yield {'id': None, **{field: record[field] for field in EXPORT_FIELDS[1:]}}
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps({field: row[field] for field in EXPORT_FIELDS} | {'timestamp': row['timestamp'].isoformat()}) + '\n'
+
+
+class Echo:
+    """File-like object whose write() hands back the line csv.writer produced."""
+
+    def write(self, value):
+        return value
+
+
+def csv_cell(value):
+    # Cells starting with these are run as formulas by spreadsheet apps.
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@', '\t', '\r'):
+        return "'" + value
+    return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([csv_cell(row['timestamp'].isoformat() if field == 'timestamp' else row[field]) for field in EXPORT_FIELDS])
+
+
+# format -> (line generator, content type, file extension)
+EXPORT_FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson', 'ndjson'),
+    'csv': (csv_lines, 'text/csv; charset=utf-8', 'csv'),
+}
+
+
+def buffered(lines, size=CHUNK_BYTES):
+    """Join small lines into byte chunks of roughly ``size`` bytes."""
+    parts, length = [], 0
+    for line in lines:
+        parts.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(parts).encode()
+            parts, length = [], 0
+    if parts:
+        yield ''.join(parts).encode()
+
+
+def gzipped(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(user_id, export_format, compress=False, chunk_size=1000):
+    lines = EXPORT_FORMATS[export_format][0](iter_messages(user_id, chunk_size))
+    chunks = buffered(lines)
+    return gzipped(chunks) if compress else chunks
+
+
+async def aiter_chunks(chunks):
+    """Async iterator over ``chunks``, pulling one chunk at a time from a thread.
+
+    Under ASGI, StreamingHttpResponse reads a sync iterator with
+    sync_to_async(list), which builds the whole export before sending a byte.
+    """
+    next_chunk = sync_to_async(next)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
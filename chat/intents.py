@@ -0,0 +1,282 @@
+import ast
+import operator
+import re
+from collections import namedtuple
+from datetime import datetime, timezone
+
+Route = namedtuple('Route', 'intent answer')
+
+WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def ngrams(text):
+    words = WORD_RE.findall(text)
+    return set(words) | {f'{first} {second}' for first, second in zip(words, words[1:])}
+
+
+def format_number(value):
+    if isinstance(value, int) or float(value).is_integer() and abs(value) < 1e15:
+        return f'{int(value):,}'
+    return f'{value:,.6g}'
+
+
+# unit -> (dimension, factor to that dimension's base unit)
+UNITS = {
+    unit: (dimension, factor)
+    for dimension, table in {
+        'length': {
+            ('m', 'meter', 'meters', 'metre', 'metres'): 1,
+            ('km', 'kilometer', 'kilometers', 'kilometre', 'kilometres'): 1000,
+            ('cm', 'centimeter', 'centimeters', 'centimetre', 'centimetres'): 0.01,
+            ('mm', 'millimeter', 'millimeters', 'millimetre', 'millimetres'): 0.001,
+            ('mi', 'mile', 'miles'): 1609.344,
+            ('ft', 'foot', 'feet'): 0.3048,
+            ('in', 'inch', 'inches'): 0.0254,
+            ('yd', 'yard', 'yards'): 0.9144,
+        },
+        'mass': {
+            ('kg', 'kilogram', 'kilograms', 'kilo', 'kilos'): 1,
+            ('g', 'gram', 'grams'): 0.001,
+            ('mg', 'milligram', 'milligrams'): 1e-6,
+            ('lb', 'lbs', 'pound', 'pounds'): 0.45359237,
+            ('oz', 'ounce', 'ounces'): 0.028349523125,
+        },
+        'volume': {
+            ('l', 'liter', 'liters', 'litre', 'litres'): 1,
+            ('ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres'): 0.001,
+            ('gal', 'gallon', 'gallons'): 3.785411784,
+            ('cup', 'cups'): 0.2365882365,
+        },
+        'speed': {
+            ('m/s',): 1,
+            ('km/h', 'kph', 'kmh'): 1 / 3.6,
+            ('mph',): 0.44704,
+            ('knot', 'knots', 'kn'): 0.514444,
+        },
+    }.items()
+    for names, factor in table.items()
+    for unit in names
+}
+
+
+class Intent:
+    """A locally answerable kind of question.
+
+    ``keywords`` maps unigrams and bigrams to weights and each matching
+    ``patterns`` entry adds 3; the router tries intents scoring at least
+    ``threshold``, best first. ``handle`` returns None to pass the message on.
+    """
+
+    name = ''
+    keywords = {}
+    patterns = ()
+    threshold = 1
+
+    def score(self, text, grams):
+        score = sum(weight for gram, weight in self.keywords.items() if gram in grams)
+        return score + sum(3 for pattern in self.patterns if pattern.search(text))
+
+    def handle(self, text, message):
+        raise NotImplementedError
+
+
+class IntentRouter:
+    def __init__(self, intents=()):
+        self.intents = list(intents)
+
+    def register(self, intent):
+        self.intents.append(intent)
+        return intent
+
+    def classify(self, text):
+        grams = ngrams(text)
+        scored = [(intent.score(text, grams), position, intent) for position, intent in enumerate(self.intents)]
+        return [intent for score, _, intent in sorted(scored, key=lambda item: (-item[0], item[1])) if score >= intent.threshold]
+
+    def route(self, message):
+        """Return the Route of the first intent that answers ``message``, or None."""
+        text = message.lower().strip()
+        for intent in self.classify(text):
+            answer = intent.handle(text, message)
+            if answer is not None:
+                return Route(intent.name, answer)
+        return None
+
+
+class WeatherIntent(Intent):
+    name = 'weather'
+    keywords = {
+        'weather': 2, 'forecast': 2, 'temperature': 2, 'humidity': 2, 'humid': 1,
+        'wind': 1, 'windy': 1, 'rain': 1, 'raining': 1, 'snow': 1, 'snowing': 1, 'sunny': 1,
+    }
+    patterns = (
+        re.compile(r'\b(?:is it|will it)\s+(?:going to\s+)?(?:rain|snow|be\s+(?:hot|cold|sunny|windy))'),
+        re.compile(r'\bhow\s+(?:hot|cold|warm|windy)\s+is\s+it\b'),
+    )
+    threshold = 2
+    filler = frozenset(
+        "weather forecast temperature humidity humid wind windy rain raining snow snowing sunny hot cold warm "
+        "what what's whats is it will be going to like in at for of how the a an and there outside "
+        "today tomorrow tonight now right currently current this week weekend morning afternoon evening "
+        "please tell me show give check get about do you know s".split()
+    )
+    city_after = re.compile(r"\b(?:in|at|for)\s+([a-z][a-z .'-]*)")
+    max_city_words = 3
+
+    def __init__(self, get_weather):
+        self.get_weather = get_weather
+
+    def extract_city(self, message):
+        """Return ``(city, explicit)`` for ``message``, or ``('', False)``.
+
+        A place after "in/at/for" is explicit ("weather in London tomorrow").
+        Otherwise the leftover words are taken as the city only when they
+        form one run next to a weather word ("weather London tomorrow",
+        "Paris forecast"), so "write a poem about the weather" has none.
+        """
+        lowered = message.lower()
+        match = self.city_after.search(lowered)
+        if match:
+            words = re.findall(r"[a-z][a-z.'-]*", lowered[match.start(1):])
+            original = re.findall(r"[A-Za-z][A-Za-z.'-]*", message[match.start(1):])
+            city = [word.strip(".'-") for word, lower in zip(original, words) if lower.strip(".'-") not in self.filler]
+            return ' '.join(city), True
+        words = re.findall(r"[A-Za-z][A-Za-z.'-]*", message)
+        places = [position for position, word in enumerate(words) if word.lower().strip(".'-") not in self.filler]
+        if not places or places != list(range(places[0], places[-1] + 1)):
+            return '', False
+        neighbours = [words[position].lower() for position in (places[0] - 1, places[-1] + 1) if 0 <= position < len(words)]
+        if not any(word in self.keywords for word in neighbours):
+            return '', False
+        return ' '.join(words[position].strip(".'-") for position in places), False
+
+    def handle(self, text, message):
+        city, explicit = self.extract_city(message)
+        if not city:
+            # Only ask for a city when the message is nothing but weather words;
+            # "write a poem about the weather" is a question for the LLM.
+            if all(word.strip(".'-") in self.filler for word in WORD_RE.findall(text)):
+                return "Please specify a city for weather information. For example: 'weather in London'"
+            return None
+        if len(city.split()) > self.max_city_words:
+            return None
+        return self.get_weather(city, explicit)
+
+
+class TimeIntent(Intent):
+    name = 'time'
+    # Anchored to the whole message so "what is the time complexity of
+    # quicksort" or "what is the day after tomorrow" go to the LLM.
+    patterns = (
+        re.compile(r"^what(?:'s|\s+is)\s+the\s+(?:current\s+)?(?:time|date|day)(?:\s+(?:right\s+)?(?:now|today))?(?:\s+in\s+[a-z][a-z .'_-]*)?\s*\??$"),
+        re.compile(r"^what\s+(?:time|day)\s+is\s+it(?:\s+(?:right\s+)?(?:now|today))?(?:\s+in\s+[a-z][a-z .'_-]*)?\s*\??$"),
+        re.compile(r"^(?:the\s+)?(?:current\s+(?:time|date)|today'?s\s+date|time\s+(?:right\s+)?now)\s*\??$"),
+        re.compile(r"^(?:the\s+)?(?:current\s+)?time\s+in\s+[a-z][a-z .'_-]*\??$"),
+    )
+    threshold = 3
+    place = re.compile(r"\b(?:time|date|day)\s+(?:is\s+it\s+)?(?:right\s+now\s+|now\s+)?in\s+([a-z][a-z .'_-]*?)\s*(?:right now|now)?\??$")
+    _zones = None
+
+    @classmethod
+    def zones(cls):
+        if cls._zones is None:
+            from zoneinfo import available_timezones
+
+            cls._zones = {name.rsplit('/', 1)[-1].replace('_', ' ').lower(): name for name in available_timezones() if '/' in name}
+        return cls._zones
+
+    def handle(self, text, message):
+        match = self.place.search(text)
+        if match:
+            from zoneinfo import ZoneInfo
+
+            zone = self.zones().get(match.group(1).strip())
+            if zone is None:
+                return None
+            now = datetime.now(ZoneInfo(zone))
+            return f"It's {now:%H:%M} on {now:%A, %d %B %Y} in {match.group(1).strip().title()} ({zone})."
+        now = datetime.now(timezone.utc)
+        return f"It's {now:%H:%M} UTC on {now:%A, %d %B %Y}."
+
+
+class UnitConversionIntent(Intent):
+    name = 'units'
+    patterns = (
+        re.compile(r"(-?\d+(?:\.\d+)?)\s*([a-z°/]+(?:\s[a-z]+)?)\s+(?:to|in|into|as)\s+([a-z°/]+(?:\s[a-z]+)?)\s*\??$"),
+    )
+    threshold = 3
+    units = UNITS
+    temperatures = {
+        'c': 'C', '°c': 'C', 'celsius': 'C', 'degrees celsius': 'C',
+        'f': 'F', '°f': 'F', 'fahrenheit': 'F', 'degrees fahrenheit': 'F',
+        'k': 'K', 'kelvin': 'K', 'kelvins': 'K',
+    }
+    to_kelvin = {'C': lambda value: value + 273.15, 'F': lambda value: (value - 32) * 5 / 9 + 273.15, 'K': lambda value: value}
+    from_kelvin = {'C': lambda value: value - 273.15, 'F': lambda value: (value - 273.15) * 9 / 5 + 32, 'K': lambda value: value}
+
+    def handle(self, text, message):
+        match = self.patterns[0].search(text)
+        amount, source, target = float(match.group(1)), match.group(2).strip(), match.group(3).strip()
+        if source in self.temperatures and target in self.temperatures:
+            source, target = self.temperatures[source], self.temperatures[target]
+            converted = self.from_kelvin[target](self.to_kelvin[source](amount))
+            return f'{format_number(amount)} °{source} is {format_number(round(converted, 2))} °{target}'.replace('°K', 'K')
+        if source not in self.units or target not in self.units:
+            return None
+        (source_dimension, source_factor), (target_dimension, target_factor) = self.units[source], self.units[target]
+        if source_dimension != target_dimension:
+            return None
+        return f'{format_number(amount)} {source} is {format_number(amount * source_factor / target_factor)} {target}'
+
+
+class CalculatorIntent(Intent):
+    name = 'calculator'
+    threshold = 3
+    operators = {
+        ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+        ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+        ast.USub: operator.neg, ast.UAdd: operator.pos,
+    }
+    words = (
+        (re.compile(r'\bdivided by\b'), '/'), (re.compile(r'\b(?:times|multiplied by)\b'), '*'),
+        (re.compile(r'\bplus\b'), '+'), (re.compile(r'\bminus\b'), '-'), (re.compile(r'(?<=\d)\s*x\s*(?=[\d(])'), '*'),
+        (re.compile(r'\^'), '**'),
+    )
+    prefix = re.compile(r"^(?:what(?:'s|\s+is)|calculate|compute|evaluate|solve)\s+")
+    expression = re.compile(r'^[\d\s.+\-*/%()]*\d[\d\s.+\-*/%()]*$')
+    binary = re.compile(r'[\d)]\s*(?:\*\*|//|[+\-*/%])\s*[\d(.\-]')
+
+    def expression_of(self, text):
+        text = self.prefix.sub('', text).rstrip(' ?=')
+        for pattern, replacement in self.words:
+            text = pattern.sub(replacement, text)
+        if self.expression.match(text) and self.binary.search(text):
+            return text
+        return None
+
+    def score(self, text, grams):
+        return 3 if self.expression_of(text) else 0
+
+    def evaluate(self, node):
+        if isinstance(node, ast.Expression):
+            return self.evaluate(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return node.value
+        if isinstance(node, ast.UnaryOp) and type(node.op) in self.operators:
+            return self.operators[type(node.op)](self.evaluate(node.operand))
+        if isinstance(node, ast.BinOp) and type(node.op) in self.operators:
+            left, right = self.evaluate(node.left), self.evaluate(node.right)
+            if isinstance(node.op, ast.Pow) and (abs(right) > 100 or abs(left) > 1e6):
+                raise OverflowError
+            return self.operators[type(node.op)](left, right)
+        raise ValueError
+
+    def handle(self, text, message):
+        expression = self.expression_of(text)
+        try:
+            result = self.evaluate(ast.parse(expression, mode='eval'))
+        except ZeroDivisionError:
+            return "Division by zero is undefined."
+        except (SyntaxError, ValueError, OverflowError, TypeError):
+            return None
+        return f'{expression.strip()} = {format_number(result)}'
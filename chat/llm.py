@@ -0,0 +1,265 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from . import metrics
+from .metrics import timed_upstream
+from .streaming import stream_generate
+from .upstream import build_client
+
+llm_attempts = metrics.registry.counter('chat_llm_attempts_total', 'LLM requests by provider, why they were sent and how they ended.', ['provider', 'reason', 'outcome'])
+
+
+class Cancelled(Exception):
+    pass
+
+
+class LatencyStats:
+    """Rolling window of a provider's recent latencies."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, percent):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+
+class Provider:
+    """One Gemini model, with its own connection pool, circuit breaker and latency stats.
+
+    Full responses and time to the first streamed chunk are tracked
+    separately, as they are hedged against separately.
+    """
+
+    def __init__(self, model, base_url, window=200):
+        self.name = model
+        self.client = build_client(f'gemini:{model}', base_url)
+        self.generate_path = f'/v1beta/models/{model}:generateContent'
+        self.stream_url = f'{base_url.rstrip("/")}/v1beta/models/{model}:streamGenerateContent'
+        self.stats = LatencyStats(window)
+        self.stream_stats = LatencyStats(window)
+
+    def generate(self, contents, cancelled):
+        start = time.monotonic()
+        with timed_upstream(self.client.name):
+            response = self.client.post(self.generate_path, params={'key': settings.GEMINI_API_KEY}, json={'contents': contents}, stream=True)
+            try:
+                # Losing hedges still count: leaving out the slow calls would
+                # drag the percentile down. One that has already lost drops
+                # its connection rather than reading the body.
+                if cancelled.is_set():
+                    self.stats.record(time.monotonic() - start)
+                    raise Cancelled()
+                response.raise_for_status()
+                text = response.json()['candidates'][0]['content']['parts'][0]['text']
+            finally:
+                response.close()
+        self.stats.record(time.monotonic() - start)
+        return text
+
+    async def stream(self, contents, chunks):
+        """Put the streamed text on ``chunks``, then None, or the exception it failed with."""
+        start = time.monotonic()
+        first = True
+        try:
+            async for text in stream_generate(self.client, self.stream_url, contents):
+                if first:
+                    self.stream_stats.record(time.monotonic() - start)
+                    first = False
+                chunks.put_nowait(text)
+        except asyncio.CancelledError:
+            if first:
+                # Cancelled before it answered: the elapsed time is a lower bound.
+                self.stream_stats.record(time.monotonic() - start)
+            raise
+        except Exception as e:
+            chunks.put_nowait(e)
+            return
+        chunks.put_nowait(ValueError(f'{self.name} returned an empty response') if first else None)
+
+
+def parse_providers(entries, default_base, window=200):
+    """Providers from ``model`` or ``model@base_url`` entries, in order."""
+    providers = []
+    for entry in entries:
+        model, _, base_url = entry.partition('@')
+        providers.append(Provider(model.strip(), base_url.strip() or default_base, window))
+    return providers
+
+
+class ProviderChain:
+    """Sends LLM requests down an ordered list of providers.
+
+    A provider that fails hands over to the next one straight away. If the
+    current provider is still running after its hedge delay, the next one
+    is started alongside it (at most two in flight); the first success wins
+    and the loser is cancelled. The hedge delay is the provider's own recent
+    ``hedge_percentile`` latency once it has ``min_samples`` of them, clamped
+    to [min_delay, max_delay], and ``hedge_delay`` before that.
+    """
+
+    def __init__(self, providers, hedge=True, hedge_percentile=95, hedge_delay=2.0, min_delay=0.25,
+                 max_delay=10.0, min_samples=20, deadline=45.0, max_workers=128):
+        self.providers = providers
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.deadline = deadline
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='llm')
+
+    def delay_for(self, stats):
+        if len(stats) < self.min_samples:
+            return self.hedge_delay
+        return min(self.max_delay, max(self.min_delay, stats.percentile(self.hedge_percentile)))
+
+    def generate(self, contents):
+        """The text of the first provider to answer; raises the last error if none does."""
+        remaining = list(self.providers)
+        running = {}
+        error = None
+        hedge_at = None
+        deadline = time.monotonic() + self.deadline
+
+        def launch(reason):
+            nonlocal hedge_at
+            provider = remaining.pop(0)
+            cancelled = threading.Event()
+            # Run in a copy of this context so the upstream call shows up in Server-Timing.
+            future = self._executor.submit(contextvars.copy_context().run, provider.generate, contents, cancelled)
+            running[future] = (provider, reason, cancelled)
+            hedge_at = time.monotonic() + self.delay_for(provider.stats) if self.hedge and remaining else None
+
+        launch('primary')
+        try:
+            while running:
+                now = time.monotonic()
+                if now >= deadline:
+                    raise TimeoutError(f'No LLM response within {self.deadline}s')
+                hedge_due = hedge_at if remaining and len(running) < 2 else None
+                timeout = deadline - now if hedge_due is None else max(0.0, min(hedge_due, deadline) - now)
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    provider, reason, _ = running.pop(future)
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        llm_attempts.inc(provider=provider.name, reason=reason, outcome='error')
+                        error = e
+                        continue
+                    llm_attempts.inc(provider=provider.name, reason=reason, outcome='ok')
+                    return text
+                if remaining and (not running or hedge_due is not None and time.monotonic() >= hedge_due):
+                    launch('fallback' if not running else 'hedge')
+            raise error
+        finally:
+            for future, (provider, reason, cancelled) in running.items():
+                cancelled.set()
+                if future.cancel() or not future.done():
+                    llm_attempts.inc(provider=provider.name, reason=reason, outcome='cancelled')
+
+    async def stream(self, contents):
+        """Yield text chunks from the first provider to start answering.
+
+        Hedging and fallback only apply until a provider sends its first
+        chunk; after that the answer is committed to it.
+        """
+        remaining = list(self.providers)
+        running = {}
+        error = None
+        hedge_at = None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+
+        def launch(reason):
+            nonlocal hedge_at
+            provider = remaining.pop(0)
+            chunks = asyncio.Queue()
+            task = asyncio.create_task(provider.stream(contents, chunks))
+            running[asyncio.create_task(chunks.get())] = (provider, reason, task, chunks)
+            hedge_at = loop.time() + self.delay_for(provider.stream_stats) if self.hedge and remaining else None
+
+        launch('primary')
+        winner = first = None
+        try:
+            while running and winner is None:
+                now = loop.time()
+                if now >= deadline:
+                    raise TimeoutError(f'No LLM response within {self.deadline}s')
+                hedge_due = hedge_at if remaining and len(running) < 2 else None
+                timeout = deadline - now if hedge_due is None else max(0.0, min(hedge_due, deadline) - now)
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for getter in done:
+                    provider, reason, task, chunks = running.pop(getter)
+                    item = getter.result()
+                    if isinstance(item, Exception):
+                        llm_attempts.inc(provider=provider.name, reason=reason, outcome='error')
+                        error = item
+                    elif winner is None:
+                        llm_attempts.inc(provider=provider.name, reason=reason, outcome='ok')
+                        winner, first = (provider, reason, task, chunks), item
+                    else:
+                        running[getter] = (provider, reason, task, chunks)
+                if winner is None and remaining and (not running or hedge_due is not None and loop.time() >= hedge_due):
+                    launch('fallback' if not running else 'hedge')
+            if winner is None:
+                raise error
+        finally:
+            for getter, (provider, reason, task, _) in running.items():
+                getter.cancel()
+                task.cancel()
+                llm_attempts.inc(provider=provider.name, reason=reason, outcome='cancelled')
+        _, _, task, chunks = winner
+        try:
+            item = first
+            while item is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+                item = await chunks.get()
+        finally:
+            task.cancel()
+
+
+def provider_stats():
+    values = {}
+    for provider in LLM.providers:
+        for mode, stats in (('generate', provider.stats), ('stream_first_chunk', provider.stream_stats)):
+            for quantile in (50, 95):
+                latency = stats.percentile(quantile)
+                if latency is not None:
+                    values[(provider.name, mode, str(quantile / 100))] = latency
+    yield 'chat_llm_provider_latency_seconds', 'gauge', 'Recent LLM latency per provider, the basis of the hedge delay.', ['provider', 'mode', 'quantile'], values
+
+
+LLM = ProviderChain(
+    parse_providers(settings.LLM_PROVIDERS, settings.GEMINI_API_BASE, settings.LLM_LATENCY_WINDOW),
+    hedge=settings.LLM_HEDGE,
+    hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+    hedge_delay=settings.LLM_HEDGE_DELAY,
+    min_delay=settings.LLM_HEDGE_MIN_DELAY,
+    max_delay=settings.LLM_HEDGE_MAX_DELAY,
+    min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+    deadline=settings.LLM_DEADLINE,
+    max_workers=settings.LLM_MAX_WORKERS,
+)
+metrics.registry.add_collector(provider_stats)
@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def claim_batch(batch_size, lease):
+    # Claiming pushes next_attempt_at out by the lease instead of changing the
+    # status, so rows held by a worker that dies are picked up again later.
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        if emails:
+            OutboundEmail.objects.filter(id__in=[email.id for email in emails]).update(next_attempt_at=now + lease)
+    return emails
+
+
+def record_attempt(email, error, max_attempts, retry_delay):
+    email.attempts += 1
+    if error is None:
+        email.status = OutboundEmail.SENT
+        email.sent_at = timezone.now()
+    else:
+        email.last_error = str(error)
+        if email.attempts >= max_attempts:
+            email.status = OutboundEmail.FAILED
+        else:
+            email.next_attempt_at = timezone.now() + retry_delay * 2 ** (email.attempts - 1)
+        logger.warning('Failed to send queued email %s (attempt %d): %s', email.id, email.attempts, error)
+    email.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at', 'sent_at'])
+
+
+def send_batch(emails, max_attempts, retry_delay):
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            record_attempt(email, e, max_attempts, retry_delay)
+        return
+    try:
+        for email in emails:
+            message = EmailMessage(email.subject, email.body, email.from_email or None, email.recipients, connection=connection)
+            try:
+                message.send()
+            except Exception as e:
+                record_attempt(email, e, max_attempts, retry_delay)
+            else:
+                record_attempt(email, None, max_attempts, retry_delay)
+    finally:
+        connection.close()
+
+
+def dispatch_once(batch_size=None):
+    batch_size = batch_size or settings.MAIL_QUEUE_BATCH_SIZE
+    emails = claim_batch(batch_size, timedelta(seconds=settings.MAIL_QUEUE_LEASE))
+    if emails:
+        send_batch(emails, settings.MAIL_QUEUE_MAX_ATTEMPTS, timedelta(seconds=settings.MAIL_QUEUE_RETRY_DELAY))
+    return len(emails)
+
+
+class MailDispatcher:
+    """Pool of daemon threads draining the OutboundEmail outbox.
+
+    Each worker claims a batch of due rows and sends the whole batch over
+    a single SMTP connection. Workers sleep for ``poll_interval`` between
+    empty polls and are woken early by ``wake()`` after an enqueue.
+    """
+
+    def __init__(self, workers=2, poll_interval=5.0):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        # Compared against the pid so a dispatcher started before a fork
+        # still gets its threads in each worker.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._threads = []
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'mail-dispatcher-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._pid = os.getpid()
+
+    def wake(self):
+        self.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            try:
+                sent = dispatch_once()
+            except Exception:
+                logger.exception('Mail dispatcher batch failed')
+                sent = 0
+            finally:
+                close_old_connections()
+            if not sent:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+
+dispatcher = MailDispatcher(settings.MAIL_QUEUE_WORKERS, settings.MAIL_QUEUE_POLL_INTERVAL)
+
+
+def enqueue_mail(subject, message, from_email, recipient_list):
+    email = OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or '',
+        recipients=list(recipient_list),
+    )
+    if settings.MAIL_QUEUE_MODE == 'thread':
+        transaction.on_commit(dispatcher.wake)
+    return email
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from chat.models import ArchivedChatMessage, ChatMessage
+
+
+class Command(BaseCommand):
+    help = 'Move chat messages older than N days from the hot table into the archive table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHAT_ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batch_size = options['batch_size']
+        fields = ('id', 'user_id', 'message', 'response', 'timestamp')
+        moved = 0
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    ChatMessage.objects.filter(timestamp__lt=cutoff)
+                    .order_by('id')
+                    .values(*fields)[:batch_size]
+                )
+                if not rows:
+                    break
+                ArchivedChatMessage.objects.bulk_create(
+                    [ArchivedChatMessage(**row) for row in rows],
+                    ignore_conflicts=True,
+                )
+                ChatMessage.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            moved += len(rows)
+            self.stdout.write(f'Archived {moved} messages...')
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} messages older than {cutoff:%Y-%m-%d}.'))
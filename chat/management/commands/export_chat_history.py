@@ -0,0 +1,38 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.export import EXPORT_FORMATS, export_chunks
+
+
+class Command(BaseCommand):
+    help = 'Export chat history to one file per user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', default=[], help='Username to export; repeat for several. Defaults to all users.')
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--output', default='chat_exports', help='Directory to write the exports to.')
+        parser.add_argument('--chunk-size', type=int, default=settings.CHAT_EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user']:
+            users = users.filter(username__in=options['user'])
+            missing = set(options['user']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f'Unknown user(s): {", ".join(sorted(missing))}')
+        output = Path(options['output'])
+        output.mkdir(parents=True, exist_ok=True)
+        extension = EXPORT_FORMATS[options['format']][2] + ('.gz' if options['gzip'] else '')
+        exported = 0
+        for user_id, username in users.values_list('id', 'username').iterator():
+            path = output / f'{user_id}-{username}.{extension}'
+            with open(path, 'wb') as f:
+                for chunk in export_chunks(user_id, options['format'], options['gzip'], options['chunk_size']):
+                    f.write(chunk)
+            exported += 1
+            self.stdout.write(f'Exported {username} to {path}')
+        self.stdout.write(self.style.SUCCESS(f'Exported chat history for {exported} users.'))
@@ -0,0 +1,67 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from chat.account_deletion import process_once, schedule_deletion
+from chat.models import AccountDeletion
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete accounts and their chat data in chunks. Schedules the given users '
+        '(or every deactivated account with --inactive), then works through pending jobs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', default=[], help='Username to delete (repeatable)')
+        parser.add_argument('--inactive', action='store_true', help='Delete every deactivated account (lists them unless --yes)')
+        parser.add_argument('--yes', action='store_true', help='Confirm deleting the accounts found by --inactive')
+        parser.add_argument('--chunk-size', type=int, default=settings.ACCOUNT_DELETION_CHUNK_SIZE)
+        parser.add_argument('--loop', action='store_true')
+        parser.add_argument('--status', action='store_true', help='List unfinished jobs and exit')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            for job in AccountDeletion.objects.exclude(status=AccountDeletion.DONE).order_by('requested_at'):
+                self.stdout.write(
+                    f'{job.username} (id {job.user_id}): {job.status}, {job.messages_deleted} messages, '
+                    f'{job.archived_deleted} archived, {job.conversations_deleted} conversations deleted'
+                    + (f', last error: {job.last_error}' if job.last_error else '')
+                )
+            return
+
+        users = list(User.objects.filter(username__in=options['user']))
+        missing = set(options['user']) - {user.username for user in users}
+        if missing:
+            raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+        if options['inactive']:
+            # Admins also deactivate accounts they mean to keep, so these are
+            # only listed until the deletion is confirmed.
+            inactive = list(User.objects.filter(is_active=False).exclude(id__in=AccountDeletion.objects.values('user_id')))
+            if inactive and not options['yes']:
+                names = ', '.join(user.username for user in inactive[:20]) + (', ...' if len(inactive) > 20 else '')
+                raise CommandError(
+                    f'{len(inactive)} deactivated accounts would be deleted permanently: {names}. '
+                    'Re-run with --yes to delete them.'
+                )
+            users += inactive
+        for user in users:
+            schedule_deletion(user)
+        if users:
+            self.stdout.write(f'Scheduled {len(users)} accounts for deletion.')
+
+        total = 0
+        while True:
+            try:
+                processed = process_once(options['chunk_size'])
+            finally:
+                close_old_connections()
+            total += processed
+            if not processed:
+                if not options['loop']:
+                    break
+                time.sleep(settings.ACCOUNT_DELETION_POLL_INTERVAL)
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} account deletions.'))
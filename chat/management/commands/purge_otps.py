@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from chat.models import OTP, OTP_LIFETIME
+
+
+class Command(BaseCommand):
+    help = 'Delete used and expired OTP codes.'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - OTP_LIFETIME
+        deleted, _ = OTP.objects.filter(Q(is_used=True) | Q(created_at__lt=cutoff)).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} used or expired OTP codes.'))
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from chat.mail_queue import dispatch_once
+
+
+class Command(BaseCommand):
+    help = 'Send due emails from the outbox. With --loop, keep polling like a worker process.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=settings.MAIL_QUEUE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            try:
+                sent = dispatch_once(options['batch_size'])
+            finally:
+                close_old_connections()
+            total += sent
+            if not sent:
+                if not options['loop']:
+                    break
+                time.sleep(settings.MAIL_QUEUE_POLL_INTERVAL)
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} queued emails.'))
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from chat.compression import WINDOW_SIZE, TextCodec, codec, train_dictionary
+from chat.models import ChatMessage, CompressionDictionary
+
+
+def stored_size(test_codec, samples):
+    return sum(len(test_codec.encode(text)) for text in samples)
+
+
+class Command(BaseCommand):
+    help = 'Train a compression dictionary from recent chat answers and use it for new ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=int, default=2000, help='Number of recent answers to learn from.')
+        parser.add_argument('--size', type=int, default=WINDOW_SIZE, help='Dictionary size in bytes (at most 32768).')
+        parser.add_argument('--dry-run', action='store_true', help='Report the savings without saving the dictionary.')
+
+    def handle(self, *args, **options):
+        if not 0 < options['size'] <= WINDOW_SIZE:
+            raise CommandError(f'--size must be between 1 and {WINDOW_SIZE}.')
+        rows = ChatMessage.objects.order_by('-id').values_list('response', flat=True)[:options['sample']]
+        samples = [text for text in rows if len(text.encode()) >= settings.CHAT_COMPRESS_MIN_LENGTH]
+        if len(samples) < 20:
+            raise CommandError(f'Only {len(samples)} answers are long enough to be compressed; not enough to train on.')
+        # Learn from every other sample and measure on the rest.
+        training, held_out = samples[::2], samples[1::2]
+        data = train_dictionary(training, options['size'])
+        plain = TextCodec(settings.CHAT_COMPRESS_MIN_LENGTH, settings.CHAT_COMPRESS_LEVEL, use_dictionary=False)
+        trained = TextCodec(settings.CHAT_COMPRESS_MIN_LENGTH, settings.CHAT_COMPRESS_LEVEL, dictionary=(255, data))
+        raw = sum(len(text.encode()) for text in held_out)
+        without, with_dictionary = stored_size(plain, held_out), stored_size(trained, held_out)
+        self.stdout.write(
+            f'{len(held_out)} held-out answers: {raw} bytes raw, {without} deflated ({without / raw:.1%}), '
+            f'{with_dictionary} with the {len(data)}-byte dictionary ({with_dictionary / raw:.1%}).'
+        )
+        if options['dry_run']:
+            return
+        next_id = (CompressionDictionary.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        if next_id > 255:
+            raise CommandError('All 255 dictionary ids are in use.')
+        CompressionDictionary.objects.create(id=next_id, data=data, sample_size=len(training))
+        codec.refresh()
+        self.stdout.write(self.style.SUCCESS(
+            f'Saved dictionary {next_id}. Restart the app servers to compress new answers with it.'
+        ))
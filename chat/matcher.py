@@ -0,0 +1,94 @@
+from collections import deque
+
+
+class ResponseMatcher:
+    """Precompiled lookup over canned question/answer pairs.
+
+    Exact matches are a dict lookup. Substring matches run through an
+    Aho-Corasick automaton so a message is scanned once regardless of how
+    many questions are loaded; when several questions occur in the message
+    the one that appears first in the source order wins, same as the old
+    linear scan.
+    """
+
+    def __init__(self, responses=()):
+        pairs = responses.items() if hasattr(responses, 'items') else responses
+        self._exact = {}
+        self._answers = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._best = [None]
+        for question, answer in pairs:
+            if question in self._exact:
+                continue
+            self._exact[question] = answer
+            self._add(question, len(self._answers))
+            self._answers.append(answer)
+        self._link()
+
+    def __len__(self):
+        return len(self._answers)
+
+    def _add(self, pattern, order):
+        node = 0
+        for char in pattern:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(None)
+            node = nxt
+        if self._best[node] is None:
+            self._best[node] = order
+
+    def _link(self):
+        # Breadth-first so every fail target is finalised before its users;
+        # each node's best then folds in the best of everything its fail
+        # chain reaches, which makes scanning a single lookup per character.
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+            self._best[node] = _min_order(self._best[node], self._best[self._fail[node]])
+
+    def exact(self, text):
+        return self._exact.get(text)
+
+    def search(self, text):
+        goto, fail, best = self._goto, self._fail, self._best
+        found = best[0]
+        if found == 0:
+            return self._answers[0]
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            hit = best[node]
+            if hit is not None and (found is None or hit < found):
+                found = hit
+                if found == 0:
+                    break
+        return None if found is None else self._answers[found]
+
+    def match(self, text):
+        answer = self._exact.get(text)
+        if answer is not None:
+            return answer
+        return self.search(text)
+
+
+def _min_order(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
@@ -0,0 +1,191 @@
+"""In-process Prometheus metrics for the /metrics endpoint.
+
+Every worker process keeps its own registry, and it starts from zero when
+the process does. A scrape therefore reports only the worker that served
+it: run a single worker when these numbers matter, or scrape each worker
+separately. process_start_time_seconds tells a restart from a drop.
+"""
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+# Spans recorded while handling the current request, used for Server-Timing.
+request_spans = contextvars.ContextVar('request_spans', default=None)
+# Single-item list counting queries run on behalf of the current request.
+request_queries = contextvars.ContextVar('request_queries', default=None)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket', _format_labels(self.labelnames, key, [('le', _format_value(bound))]), cumulative
+            yield f'{self.name}_sum', _format_labels(self.labelnames, key), total
+            yield f'{self.name}_count', _format_labels(self.labelnames, key), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """Register a callable yielding ``(name, kind, documentation, labelnames, {label_values: value})``.
+
+        Collectors are read at scrape time, for values that already live elsewhere.
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        for collector in self._collectors:
+            for name, kind, documentation, labelnames, values in collector():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                for key, value in sorted(values.items()):
+                    lines.append(f'{name}{_format_labels(labelnames, key)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.counter('chat_http_requests_total', 'HTTP requests handled.', ['view', 'method', 'status'])
+http_latency = registry.histogram('chat_http_request_duration_seconds', 'Time spent handling HTTP requests.', ['view'])
+db_queries = registry.histogram('chat_db_queries_per_request', 'Database queries executed per HTTP request.', ['view'], QUERY_BUCKETS)
+stage_latency = registry.histogram('chat_stage_duration_seconds', 'Time spent in a stage of the chat pipeline.', ['stage'])
+upstream_latency = registry.histogram('chat_upstream_duration_seconds', 'Latency of calls to upstream APIs.', ['upstream', 'outcome'])
+answers = registry.counter('chat_answers_total', 'Chat replies by where the answer came from.', ['source'])
+
+START_TIME = time.time()
+registry.add_collector(lambda: [('process_start_time_seconds', 'gauge', 'Start time of this worker process since the epoch.', [], {(): START_TIME})])
+
+
+def record_span(name, duration):
+    spans = request_spans.get()
+    if spans is not None:
+        spans.append((name, duration))
+
+
+def count_queries(execute, sql, params, many, context):
+    counter = request_queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    # Fires on every reconnect of the same wrapper object; install only once.
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+@contextmanager
+def timed(stage):
+    """Time a block into the stage histogram and the request's Server-Timing spans."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        stage_latency.observe(duration, stage=stage)
+        record_span(stage, duration)
+
+
+@contextmanager
+def timed_upstream(upstream):
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        duration = time.perf_counter() - start
+        upstream_latency.observe(duration, upstream=upstream, outcome=outcome)
+        record_span(upstream, duration)
@@ -0,0 +1,92 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.functional import SimpleLazyObject
+
+from . import metrics, user_cache
+
+
+class MetricsMiddleware:
+    """Records per-view latency, status and DB query counts.
+
+    Works in both WSGI and ASGI stacks without an extra thread hop. With
+    METRICS_SERVER_TIMING enabled the spans recorded by ``metrics.timed``
+    during the request are also returned in a Server-Timing header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = self.begin()
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            self.finish(request, response, *state)
+        return response
+
+    async def __acall__(self, request):
+        state = self.begin()
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.finish(request, response, *state)
+        return response
+
+    def begin(self):
+        spans = []
+        queries = [0]
+        tokens = (metrics.request_spans.set(spans), metrics.request_queries.set(queries))
+        return time.perf_counter(), spans, queries, tokens
+
+    def finish(self, request, response, start, spans, queries, tokens):
+        duration = time.perf_counter() - start
+        metrics.request_spans.reset(tokens[0])
+        metrics.request_queries.reset(tokens[1])
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unmatched'
+        status = response.status_code if response is not None else 500
+        metrics.http_requests.inc(view=view, method=request.method, status=status)
+        metrics.http_latency.observe(duration, view=view)
+        metrics.db_queries.observe(queries[0], view=view)
+        if response is not None and settings.METRICS_SERVER_TIMING:
+            totals = {}
+            for name, span in spans:
+                totals[name] = totals.get(name, 0.0) + span
+            entries = [f'{name};dur={span * 1000:.1f}' for name, span in totals.items()]
+            entries.append(f'db;desc="{queries[0]} queries"')
+            entries.append(f'total;dur={duration * 1000:.1f}')
+            response['Server-Timing'] = ', '.join(entries)
+
+
+def get_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = user_cache.get_user(request)
+    return request._cached_user
+
+
+async def auser(request):
+    if not hasattr(request, '_acached_user'):
+        request._acached_user = await sync_to_async(user_cache.get_user)(request)
+    return request._acached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware that resolves request.user through chat.user_cache."""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
+        request.auser = lambda: auser(request)
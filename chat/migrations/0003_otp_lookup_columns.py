@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:38
+
+from django.db import migrations, models
+
+
+def copy_user_data_to_columns(apps, schema_editor):
+    OTP = apps.get_model('chat', 'OTP')
+    batch = []
+    for otp in OTP.objects.only('id', 'user_data').iterator(chunk_size=1000):
+        otp.email = otp.user_data.get('email') or ''
+        otp.username = otp.user_data.get('username') or ''
+        batch.append(otp)
+        if len(batch) >= 1000:
+            OTP.objects.bulk_update(batch, ['email', 'username'])
+            batch = []
+    if batch:
+        OTP.objects.bulk_update(batch, ['email', 'username'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_chatmessage_index_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='otp',
+            name='email',
+            field=models.EmailField(blank=True, default='', max_length=254),
+        ),
+        migrations.AddField(
+            model_name='otp',
+            name='username',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=150),
+        ),
+        migrations.AlterField(
+            model_name='otp',
+            name='purpose',
+            field=models.CharField(db_index=True, default='signup', max_length=20),
+        ),
+        migrations.RunPython(copy_user_data_to_columns, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['email', 'purpose', 'is_used'], name='chat_otp_email_purpose_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+from django.db import migrations
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE chat_chatmessage_fts USING fts5("
+    "message, response, content='chat_chatmessage', content_rowid='id', tokenize='porter unicode61')",
+    "INSERT INTO chat_chatmessage_fts(chat_chatmessage_fts) VALUES ('rebuild')",
+    "CREATE TRIGGER chat_chatmessage_fts_ai AFTER INSERT ON chat_chatmessage BEGIN "
+    "INSERT INTO chat_chatmessage_fts(rowid, message, response) VALUES (new.id, new.message, new.response); END",
+    "CREATE TRIGGER chat_chatmessage_fts_ad AFTER DELETE ON chat_chatmessage BEGIN "
+    "INSERT INTO chat_chatmessage_fts(chat_chatmessage_fts, rowid, message, response) "
+    "VALUES ('delete', old.id, old.message, old.response); END",
+    "CREATE TRIGGER chat_chatmessage_fts_au AFTER UPDATE OF message, response ON chat_chatmessage BEGIN "
+    "INSERT INTO chat_chatmessage_fts(chat_chatmessage_fts, rowid, message, response) "
+    "VALUES ('delete', old.id, old.message, old.response); "
+    "INSERT INTO chat_chatmessage_fts(rowid, message, response) VALUES (new.id, new.message, new.response); END",
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS chat_chatmessage_fts_ai',
+    'DROP TRIGGER IF EXISTS chat_chatmessage_fts_ad',
+    'DROP TRIGGER IF EXISTS chat_chatmessage_fts_au',
+    'DROP TABLE IF EXISTS chat_chatmessage_fts',
+]
+
+
+def add_search_index(apps, schema_editor):
+    # MySQL maintains FULLTEXT indexes on every write; on SQLite an external
+    # content FTS5 table is kept in step by triggers. Other backends fall
+    # back to LIKE in chat.search.
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE chat_chatmessage ADD FULLTEXT INDEX chat_msg_fulltext_idx (message, response)')
+    elif vendor == 'sqlite':
+        for statement in SQLITE_CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE chat_chatmessage DROP INDEX chat_msg_fulltext_idx')
+    elif vendor == 'sqlite':
+        for statement in SQLITE_DROP:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_account_deletion'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_index, drop_search_index),
+    ]
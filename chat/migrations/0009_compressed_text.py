@@ -0,0 +1,101 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:05
+
+import importlib
+
+import chat.compression
+from django.conf import settings
+from django.db import migrations, models
+
+search_index = importlib.import_module('chat.migrations.0008_chatmessage_search_index')
+
+TABLES = ('chat_chatmessage', 'chat_archivedchatmessage')
+BATCH_SIZE = 500
+
+# 0008's index without the response column, which FULLTEXT and FTS5 cannot
+# read once it is compressed. Questions stay plain text and searchable.
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE chat_chatmessage_fts USING fts5("
+    "message, content='chat_chatmessage', content_rowid='id', tokenize='porter unicode61')",
+    "INSERT INTO chat_chatmessage_fts(chat_chatmessage_fts) VALUES ('rebuild')",
+    "CREATE TRIGGER chat_chatmessage_fts_ai AFTER INSERT ON chat_chatmessage BEGIN "
+    "INSERT INTO chat_chatmessage_fts(rowid, message) VALUES (new.id, new.message); END",
+    "CREATE TRIGGER chat_chatmessage_fts_ad AFTER DELETE ON chat_chatmessage BEGIN "
+    "INSERT INTO chat_chatmessage_fts(chat_chatmessage_fts, rowid, message) VALUES ('delete', old.id, old.message); END",
+    "CREATE TRIGGER chat_chatmessage_fts_au AFTER UPDATE OF message ON chat_chatmessage BEGIN "
+    "INSERT INTO chat_chatmessage_fts(chat_chatmessage_fts, rowid, message) VALUES ('delete', old.id, old.message); "
+    "INSERT INTO chat_chatmessage_fts(rowid, message) VALUES (new.id, new.message); END",
+]
+
+
+def rewrite_rows(schema_editor, convert):
+    connection = schema_editor.connection
+    for table in TABLES:
+        table = connection.ops.quote_name(table)
+        last_id = 0
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT id, response FROM {table} WHERE id > %s ORDER BY id LIMIT %s', [last_id, BATCH_SIZE])
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                changed = []
+                for row_id, response in rows:
+                    new_response = convert(response)
+                    if new_response != response:
+                        changed.append((new_response, row_id))
+                if changed:
+                    cursor.executemany(f'UPDATE {table} SET response = %s WHERE id = %s', changed)
+
+
+def compress_text(apps, schema_editor):
+    # Existing rows are deflated without a dictionary; none has been trained yet.
+    codec = chat.compression.TextCodec(settings.CHAT_COMPRESS_MIN_LENGTH, settings.CHAT_COMPRESS_LEVEL, use_dictionary=False)
+    # SQLite keeps the copied values as TEXT, which never equals a BLOB, so every row is rewritten there.
+    rewrite_rows(schema_editor, lambda value: codec.encode(value if isinstance(value, str) else bytes(value).decode()))
+
+
+def decompress_text(apps, schema_editor):
+    codec = chat.compression.codec
+    rewrite_rows(schema_editor, codec.decode)
+
+
+def add_message_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE chat_chatmessage ADD FULLTEXT INDEX chat_msg_fulltext_idx (message)')
+    elif vendor == 'sqlite':
+        for statement in SQLITE_CREATE:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_chatmessage_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(search_index.drop_search_index, search_index.add_search_index),
+        migrations.CreateModel(
+            name='CompressionDictionary',
+            fields=[
+                ('id', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('sample_size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='archivedchatmessage',
+            name='response',
+            field=chat.compression.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='response',
+            field=chat.compression.CompressedTextField(),
+        ),
+        migrations.RunPython(compress_text, decompress_text),
+        migrations.RunPython(add_message_index, search_index.drop_search_index),
+    ]
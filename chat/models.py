@@ -5,30 +5,140 @@ import string
 from django.utils import timezone
 from datetime import timedelta
 
+from .compression import CompressedTextField
+
+OTP_LIFETIME = timedelta(minutes=10)
+
 class OTP(models.Model):
     user_data = models.JSONField()
+    email = models.EmailField(blank=True, default='')
+    username = models.CharField(max_length=150, blank=True, default='', db_index=True)
     code = models.CharField(max_length=6)
     created_at = models.DateTimeField(auto_now_add=True)
     is_used = models.BooleanField(default=False)
-    purpose = models.CharField(max_length=20, default='signup')
+    purpose = models.CharField(max_length=20, default='signup', db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['email', 'purpose', 'is_used'], name='chat_otp_email_purpose_idx'),
+        ]
     
     def is_valid(self):
-        return not self.is_used and (timezone.now() - self.created_at) < timedelta(minutes=10)
+        return not self.is_used and (timezone.now() - self.created_at) < OTP_LIFETIME
     
     @classmethod
     def generate_otp(cls, user_data, purpose='signup'):
-        cls.objects.filter(user_data__email=user_data['email'], purpose=purpose).delete()
+        cls.objects.filter(email=user_data['email'], purpose=purpose).delete()
         code = ''.join(random.choices(string.digits, k=6))
-        return cls.objects.create(user_data=user_data, code=code, purpose=purpose)
+        return cls.objects.create(
+            user_data=user_data,
+            email=user_data['email'],
+            username=user_data.get('username', ''),
+            code=code,
+            purpose=purpose,
+        )
+
+class Conversation(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations')
+    summary = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username}: conversation {self.pk}"
 
 class ChatMessage(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='messages')
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages', null=True, blank=True)
+    # Only the answer is compressed; questions are short and carry the search index.
     message = models.TextField()
-    response = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    response = CompressedTextField()
+    timestamp = models.DateTimeField(default=timezone.now)
     
     class Meta:
-        ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='chat_msg_user_ts_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.user.username}: {self.message[:50]}"
\ No newline at end of file
+        return f"{self.user.username}: {self.message[:50]}"
+
+class ArchivedChatMessage(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_messages')
+    message = models.TextField()
+    response = CompressedTextField()
+    timestamp = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='chat_arch_user_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.message[:50]}"
+
+class OutboundEmail(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SENT, 'Sent'), (FAILED, 'Failed')]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True, default='')
+    recipients = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='chat_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)}"
+
+class AccountDeletion(models.Model):
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    # Not a foreign key: the job has to outlive the user row it deletes.
+    user_id = models.BigIntegerField(unique=True)
+    username = models.CharField(max_length=150)
+    email = models.EmailField(blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    messages_deleted = models.PositiveIntegerField(default=0)
+    archived_deleted = models.PositiveIntegerField(default=0)
+    conversations_deleted = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    requested_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='chat_deletion_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.username} ({self.status})"
+
+class CompressionDictionary(models.Model):
+    # Stored values name their dictionary in a single header byte.
+    id = models.PositiveSmallIntegerField(primary_key=True)
+    data = models.BinaryField()
+    sample_size = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"dictionary {self.id} ({len(self.data)} bytes)"
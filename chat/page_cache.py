@@ -0,0 +1,97 @@
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.http import HttpResponse
+from django.template.loader import get_template
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def accepted_encodings(request):
+    """Content codings the client accepts, ignoring any with q=0."""
+    encodings = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip().removeprefix('q=')
+        if coding and quality not in ('0', '0.0', '0.00', '0.000'):
+            encodings.add(coding.strip().lower())
+    return encodings
+
+
+class CachedPage:
+    """A rendered page with its validators and pre-compressed bodies."""
+
+    def __init__(self, body, last_modified, content_type='text/html; charset=utf-8'):
+        self.content_type = content_type
+        self.last_modified = last_modified
+        self.etag = 'W/"{}"'.format(hashlib.sha1(body).hexdigest())
+        self.bodies = {'identity': body}
+        encoded = {'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            encoded['br'] = brotli.compress(body, mode=brotli.MODE_TEXT)
+        for coding, data in encoded.items():
+            if len(data) < len(body):
+                self.bodies[coding] = data
+
+    def response(self, request):
+        """A 304 if the client's copy is current, else the best encoding it accepts."""
+        accepted = accepted_encodings(request)
+        coding = next((coding for coding in ('br', 'gzip') if coding in accepted and coding in self.bodies), 'identity')
+        response = HttpResponse(self.bodies[coding], content_type=self.content_type)
+        if coding != 'identity':
+            response['Content-Encoding'] = coding
+        response['ETag'] = self.etag
+        response['Last-Modified'] = http_date(self.last_modified)
+        # Pages differ per login, so browsers keep them but check back each time.
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ('Accept-Encoding', 'Cookie'))
+        return get_conditional_response(request, etag=self.etag, last_modified=self.last_modified, response=response)
+
+
+class PageCache:
+    """Rendered templates kept in memory per variant and static files manifest.
+
+    ``variant`` names whatever in the request the template output depends
+    on, such as the logged-in user; per-request values like {% csrf_token %}
+    cannot be used. Last-Modified is the template file's mtime, so every
+    worker of a deploy sends the same validators.
+    """
+
+    def __init__(self, max_entries=1000, enabled=True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, request, template_name, variant=None):
+        key = (template_name, variant, getattr(staticfiles_storage, 'manifest_hash', ''))
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+                return page
+        template = get_template(template_name)
+        body = template.render(request=request).encode()
+        page = CachedPage(body, int(os.path.getmtime(template.origin.name)))
+        if self.enabled:
+            with self._lock:
+                self._pages[key] = page
+                if len(self._pages) > self.max_entries:
+                    self._pages.popitem(last=False)
+        return page
+
+    def respond(self, request, template_name, variant=None):
+        return self.get(request, template_name, variant).response(request)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
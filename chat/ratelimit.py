@@ -0,0 +1,178 @@
+import asyncio
+import math
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'20/m' -> (20, 60): twenty requests per sixty seconds."""
+    count, _, period = rate.partition('/')
+    multiplier = int(period[:-1]) if period[:-1] else 1
+    return int(count), multiplier * PERIODS[period[-1]]
+
+
+class TokenBucket:
+    """Token bucket whose state lives in a Django cache.
+
+    The read-modify-write is not atomic across workers, so under a burst
+    of simultaneous requests a few extra may slip through; that is an
+    acceptable trade for working on any cache backend.
+    """
+
+    def __init__(self, capacity, period, cache_alias='default'):
+        self.capacity = capacity
+        self.refill_rate = capacity / period
+        self.period = period
+        self.cache_alias = cache_alias
+
+    def consume(self, key, tokens=1):
+        """Take ``tokens`` from ``key``'s bucket; return seconds to wait, 0 if allowed."""
+        cache = caches[self.cache_alias]
+        now = time.time()
+        available, updated = cache.get(key, (self.capacity, now))
+        available = min(self.capacity, available + (now - updated) * self.refill_rate)
+        if available >= tokens:
+            cache.set(key, (available - tokens, now), math.ceil(self.period))
+            return 0
+        cache.set(key, (available, now), math.ceil(self.period))
+        return (tokens - available) / self.refill_rate
+
+
+def client_ip(request):
+    if settings.RATELIMIT_TRUST_FORWARDED_FOR:
+        # Each proxy appends the address it saw, and clients can send their
+        # own header, so count back from the right past our proxies.
+        forwarded = [address.strip() for address in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if address.strip()]
+        if forwarded:
+            return forwarded[-min(settings.RATELIMIT_PROXY_COUNT, len(forwarded))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def rate_limit_keys(scope, request):
+    # Logged-in users are limited per account only: behind a proxy that
+    # hides client addresses, an IP bucket would be shared by everyone.
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return [f'ratelimit:{scope}:user:{user.pk}']
+    return [f'ratelimit:{scope}:ip:{client_ip(request)}']
+
+
+def too_many_requests(retry_after):
+    response = JsonResponse({'success': False, 'error': 'Too many requests. Please slow down and try again shortly.'}, status=429)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def rate_limit(scope, rate, methods=('POST',)):
+    """Limit ``methods`` requests to ``rate`` per logged-in user, or per client IP for anonymous ones."""
+    bucket = TokenBucket(*parse_rate(rate))
+
+    def check(request):
+        if not settings.RATELIMIT_ENABLED or request.method not in methods:
+            return 0
+        return max(bucket.consume(key) for key in rate_limit_keys(scope, request))
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                retry_after = await sync_to_async(check)(request)
+                if retry_after:
+                    return too_many_requests(retry_after)
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            retry_after = check(request)
+            if retry_after:
+                return too_many_requests(retry_after)
+            return view(request, *args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+class Overloaded(Exception):
+    pass
+
+
+class ConcurrencyLimiter:
+    """Caps in-flight upstream calls in this process.
+
+    Callers beyond ``limit`` wait in a queue of at most ``max_waiting`` for
+    up to ``timeout`` seconds; anyone past that is rejected immediately so
+    a slow upstream cannot pile up every worker behind it.
+    """
+
+    def __init__(self, limit, max_waiting, timeout):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            if self.waiting >= self.max_waiting:
+                return False
+            self.waiting += 1
+            try:
+                acquired = self._cond.wait_for(lambda: self.active < self.limit, self.timeout)
+            finally:
+                self.waiting -= 1
+            if acquired:
+                self.active += 1
+            return acquired
+
+    def try_acquire(self):
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            return False
+
+    async def aacquire(self, poll_interval=0.01):
+        # Waiting on the Condition would block the event loop, so async
+        # callers hold a queue slot and poll instead.
+        if self.try_acquire():
+            return True
+        with self._cond:
+            if self.waiting >= self.max_waiting:
+                return False
+            self.waiting += 1
+        try:
+            deadline = time.monotonic() + self.timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(poll_interval)
+                if self.try_acquire():
+                    return True
+            return False
+        finally:
+            with self._cond:
+                self.waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def __enter__(self):
+        if not self.acquire():
+            raise Overloaded()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,127 @@
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.core.cache import caches
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize_prompt(prompt):
+    return ' '.join(prompt.lower().split()).strip(' ?!.')
+
+
+class SimilarityIndex:
+    """In-process TF-IDF index of past prompts and their answers.
+
+    Candidates are found through an inverted index on prompt terms and
+    scored by cosine similarity; idf weights are computed from the entries
+    currently held, so they follow the index as it is evicted.
+    """
+
+    def __init__(self, max_entries=2000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._postings = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, prompt, answer):
+        terms = Counter(TOKEN_RE.findall(normalize_prompt(prompt)))
+        if not terms:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (terms, answer, time.monotonic())
+            for term in terms:
+                self._postings.setdefault(term, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id):
+        terms, _, _ = self._entries.pop(entry_id)
+        for term in terms:
+            posting = self._postings[term]
+            posting.discard(entry_id)
+            if not posting:
+                del self._postings[term]
+
+    def _weights(self, terms, total):
+        weights = {term: count * (math.log((1 + total) / (1 + len(self._postings.get(term, ())))) + 1) for term, count in terms.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        return {term: w / norm for term, w in weights.items()}
+
+    def search(self, prompt, threshold):
+        terms = Counter(TOKEN_RE.findall(normalize_prompt(prompt)))
+        if not terms:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            while self._entries:
+                oldest_id, (_, _, added) = next(iter(self._entries.items()))
+                if now - added < self.ttl:
+                    break
+                self._remove(oldest_id)
+            total = len(self._entries)
+            query = self._weights(terms, total)
+            candidates = set().union(*(self._postings.get(term, ()) for term in terms))
+            best_score, best_answer = 0.0, None
+            for entry_id in candidates:
+                entry_terms, answer, _ = self._entries[entry_id]
+                weights = self._weights(entry_terms, total)
+                score = sum(w * weights.get(term, 0.0) for term, w in query.items())
+                if score > best_score:
+                    best_score, best_answer = score, answer
+        return best_answer if best_score >= threshold else None
+
+
+class ResponseCache:
+    """Two-tier cache in front of the LLM.
+
+    The exact tier lives in a Django cache under a hash of the normalized
+    prompt, so it is shared between workers and bounded by the backend's
+    MAX_ENTRIES. The optional similarity tier is a per-process
+    SimilarityIndex holding only what ``set()`` stored, so it never serves
+    a custom, intent or follow-up answer that was not cached on purpose.
+    """
+
+    def __init__(self, ttl=86400, cache_alias='default', similarity_threshold=None,
+                 similarity_max_entries=2000):
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self.similarity_threshold = similarity_threshold
+        self.index = SimilarityIndex(similarity_max_entries, ttl) if similarity_threshold else None
+        self.stats = Counter()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def key(self, prompt):
+        return 'llm:' + hashlib.sha256(normalize_prompt(prompt).encode()).hexdigest()
+
+    def get(self, prompt):
+        answer = self.cache.get(self.key(prompt))
+        if answer is not None:
+            self.stats['exact_hits'] += 1
+            return answer
+        if self.index is not None:
+            answer = self.index.search(prompt, self.similarity_threshold)
+            if answer is not None:
+                self.stats['similar_hits'] += 1
+                return answer
+        self.stats['misses'] += 1
+        return None
+
+    def set(self, prompt, answer):
+        self.cache.set(self.key(prompt), answer, self.ttl)
+        if self.index is not None:
+            self.index.add(prompt, answer)
@@ -0,0 +1,120 @@
+import atexit
+import json
+import logging
+import threading
+from pathlib import Path
+
+from .matcher import ResponseMatcher
+
+logger = logging.getLogger(__name__)
+
+
+def parse_text_responses(lines):
+    custom_responses = {}
+    for line in lines:
+        if ':' in line:
+            question, answer = line.strip().split(':', 1)
+            custom_responses[question.lower().strip()] = answer.strip()
+    return list(custom_responses.items())
+
+
+def parse_jsonl_responses(lines):
+    # One object per line: {"question": ..., "answer": ..., "aliases": [...], "priority": 0}.
+    # Higher priority wins substring ties; equal priorities keep file order.
+    entries = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            item = json.loads(line)
+            answer = str(item['answer']).strip()
+            questions = [item['question'], *item.get('aliases', [])]
+            priority = int(item.get('priority', 0))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning('Skipping line %d of custom responses: %s', number, e)
+            continue
+        for question in questions:
+            entries.append((-priority, len(entries), str(question).lower().strip(), answer))
+    entries.sort()
+    return [(question, answer) for _, _, question, answer in entries]
+
+
+PARSERS = {
+    '.jsonl': parse_jsonl_responses,
+}
+
+
+class ResponseStore:
+    """Custom responses file plus its compiled ResponseMatcher.
+
+    A daemon thread polls the file's mtime and rebuilds the matcher when it
+    changes, until ``stop_watching`` or interpreter exit; the new matcher
+    replaces the old one with a single attribute assignment, so requests
+    always read a complete index and never wait on a rebuild.
+    """
+
+    def __init__(self, path, reload_interval=5.0):
+        self.path = Path(path)
+        self.reload_interval = reload_interval
+        self._matcher = ResponseMatcher()
+        self._signature = None
+        self._watcher = None
+        self._watcher_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.reload()
+
+    def __len__(self):
+        return len(self._matcher)
+
+    def _stat(self):
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self, force=True):
+        signature = self._stat()
+        if not force and signature == self._signature:
+            return False
+        if signature is None:
+            pairs = []
+        else:
+            parser = PARSERS.get(self.path.suffix.lower(), parse_text_responses)
+            with open(self.path, 'r', encoding='utf-8') as file:
+                pairs = parser(file)
+        self._matcher = ResponseMatcher(pairs)
+        self._signature = signature
+        return True
+
+    def _watch(self, stop):
+        while not stop.wait(self.reload_interval):
+            try:
+                if self.reload(force=False):
+                    logger.info('Reloaded %d custom responses from %s', len(self), self.path)
+            except Exception:
+                logger.exception('Failed to reload custom responses from %s', self.path)
+
+    def start_watching(self):
+        if self._watcher is not None or self.reload_interval <= 0:
+            return
+        with self._watcher_lock:
+            if self._watcher is None:
+                self._stop = threading.Event()
+                self._watcher = threading.Thread(target=self._watch, args=(self._stop,), name='response-store-watcher', daemon=True)
+                self._watcher.start()
+                atexit.register(self.stop_watching, 1)
+
+    def stop_watching(self, timeout=None):
+        with self._watcher_lock:
+            watcher, self._watcher = self._watcher, None
+        if watcher is None:
+            return
+        atexit.unregister(self.stop_watching)
+        self._stop.set()
+        watcher.join(timeout)
+
+    def match(self, text):
+        self.start_watching()
+        return self._matcher.match(text)
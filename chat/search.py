@@ -0,0 +1,80 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import ChatMessage
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+# Only message is indexed: response is stored compressed, which no
+# full-text index can read (see migration 0009).
+MYSQL_SEARCH = (
+    'SELECT id, message, response, timestamp, '
+    'MATCH(message) AGAINST (%s IN NATURAL LANGUAGE MODE) AS score '
+    'FROM chat_chatmessage '
+    'WHERE user_id = %s AND MATCH(message) AGAINST (%s IN NATURAL LANGUAGE MODE) '
+    'ORDER BY score DESC, id DESC LIMIT %s OFFSET %s'
+)
+
+SQLITE_SEARCH = (
+    'SELECT m.id, m.message, m.response, m.timestamp, -bm25(chat_chatmessage_fts) AS score '
+    'FROM chat_chatmessage_fts JOIN chat_chatmessage m ON m.id = chat_chatmessage_fts.rowid '
+    'WHERE chat_chatmessage_fts MATCH %s AND m.user_id = %s '
+    'ORDER BY score DESC, m.id DESC LIMIT %s OFFSET %s'
+)
+
+
+def search_terms(query):
+    return TERM_RE.findall(query.lower())
+
+
+def fts5_query(terms):
+    # Quoting every term keeps FTS5 operators in user input from being parsed.
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def snippet(text, terms, width=160):
+    """The ``width`` characters of ``text`` around the first matching term."""
+    lowered = text.lower()
+    positions = [position for position in (lowered.find(term) for term in terms) if position >= 0]
+    if not positions:
+        return None
+    start = max(0, min(positions) - width // 3)
+    end = start + width
+    if start:
+        space = text.rfind(' ', 0, start)
+        start = space + 1 if space >= 0 and start - space < 20 else start
+    return ('…' if start else '') + text[start:end].strip() + ('…' if end < len(text) else '')
+
+
+def search_messages(user_id, query, limit, offset=0):
+    """Return up to ``limit`` of the user's messages matching ``query``, best first.
+
+    Only the question side of each exchange is searched. Each result
+    carries a ``snippet`` around the first matching term. One extra row is
+    fetched so callers can tell if there are more.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    if connection.vendor == 'mysql':
+        rows = ChatMessage.objects.raw(MYSQL_SEARCH, [query, user_id, query, limit + 1, offset])
+    elif connection.vendor == 'sqlite':
+        rows = ChatMessage.objects.raw(SQLITE_SEARCH, [fts5_query(terms), user_id, limit + 1, offset])
+    else:
+        matches = Q()
+        for term in terms:
+            matches &= Q(message__icontains=term)
+        rows = ChatMessage.objects.filter(matches, user_id=user_id).order_by('-timestamp', '-id')[offset:offset + limit + 1]
+    results = []
+    for row in rows:
+        results.append({
+            'id': row.id,
+            'message': row.message,
+            'response': row.response,
+            'timestamp': row.timestamp,
+            'score': float(getattr(row, 'score', 0.0)),
+            'snippet': snippet(row.message, terms) or snippet(row.response, terms) or row.message[:160],
+        })
+    return results
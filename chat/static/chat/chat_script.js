@@ -17,6 +17,7 @@ const chatHistoryBtn = document.getElementById("chat-history-btn");
 const chatHistoryModal = document.getElementById("chat-history-modal");
 const closeChatHistoryBtn = document.getElementById("close-chat-history");
 const chatHistoryContent = document.getElementById("chat-history-content");
+const chatHistorySearch = document.getElementById("chat-history-search");
 
 function getCookie(name) {
   let cookieValue = null;
@@ -33,9 +34,7 @@ function getCookie(name) {
   return cookieValue;
 }
 
-const csrftoken =
-  getCookie("csrftoken") ||
-  document.querySelector('meta[name="csrf-token"]')?.content;
+const csrftoken = getCookie("csrftoken");
 
 function formatBotResponse(text) {
   text = text.replace(/\*\*(.*?)\*\*/g, "<strong>$1</strong>");
@@ -132,11 +131,34 @@ document.addEventListener("DOMContentLoaded", function () {
   if (chatHistoryBtn && chatHistoryModal) {
     chatHistoryBtn.addEventListener("click", () => {
       if (userMenu) userMenu.classList.remove("active");
+      if (chatHistorySearch) chatHistorySearch.value = "";
+      historyQuery = "";
       loadChatHistoryModal();
       chatHistoryModal.classList.add("active");
     });
   }
 
+  if (chatHistorySearch) {
+    let searchTimer = null;
+    chatHistorySearch.addEventListener("input", () => {
+      clearTimeout(searchTimer);
+      searchTimer = setTimeout(() => {
+        historyQuery = chatHistorySearch.value.trim();
+        loadChatHistoryModal();
+      }, 300);
+    });
+  }
+
+  if (chatHistoryContent) {
+    chatHistoryContent.addEventListener("scroll", () => {
+      const remaining =
+        chatHistoryContent.scrollHeight -
+        chatHistoryContent.scrollTop -
+        chatHistoryContent.clientHeight;
+      if (remaining < 200) loadMoreChatHistory();
+    });
+  }
+
   if (closeChatHistoryBtn && chatHistoryModal) {
     closeChatHistoryBtn.addEventListener("click", () =>
       chatHistoryModal.classList.remove("active")
@@ -169,6 +191,8 @@ document.addEventListener("DOMContentLoaded", function () {
   }
 });
 
+let conversationId = null;
+
 function sendMessage() {
   const msg = userInput.value.trim();
   if (!msg) {
@@ -180,26 +204,28 @@ function sendMessage() {
   userInput.value = "";
   appendTyping();
 
-  fetch("/api/", {
+  fetch("/api/stream/", {
     method: "POST",
     headers: {
       "Content-Type": "application/json",
       "X-CSRFToken": csrftoken,
+      Accept: "text/event-stream",
     },
-    body: JSON.stringify({ message: msg }),
+    body: JSON.stringify({ message: msg, conversation_id: conversationId }),
   })
-    .then((response) => response.json())
-    .then((data) => {
-      removeTyping();
-      if (data.success) {
-        appendMessage("bot", data.response, true);
-      } else {
+    .then((response) => {
+      if (response.status === 429) {
+        removeTyping();
         appendMessage(
           "bot",
-          "Sorry, I'm having trouble responding right now. Please try again."
+          "You're sending messages too quickly. Please wait a moment and try again."
         );
-        console.error("API Error:", data.error);
+        return;
+      }
+      if (!response.ok || !response.body) {
+        throw new Error(`HTTP error! status: ${response.status}`);
       }
+      return readEventStream(response.body);
     })
     .catch((err) => {
       removeTyping();
@@ -211,6 +237,56 @@ function sendMessage() {
     });
 }
 
+async function readEventStream(body) {
+  const reader = body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let text = "";
+  let botEl = null;
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      const dataLine = rawEvent
+        .split("\n")
+        .find((line) => line.startsWith("data:"));
+      if (!dataLine) continue;
+      const data = JSON.parse(dataLine.slice(5));
+      if (data.conversation_id) conversationId = data.conversation_id;
+      if (data.error && !botEl) {
+        removeTyping();
+        appendMessage("bot", data.error);
+        return;
+      }
+      if (data.text === undefined) continue;
+
+      text += data.text;
+      if (!botEl) {
+        removeTyping();
+        botEl = document.createElement("div");
+        botEl.classList.add("message", "bot");
+        chatBox.appendChild(botEl);
+      }
+      botEl.innerHTML = formatBotResponse(text);
+      chatBox.scrollTop = chatBox.scrollHeight;
+    }
+  }
+
+  if (!botEl) {
+    removeTyping();
+    appendMessage(
+      "bot",
+      "Sorry, I'm having trouble responding right now. Please try again."
+    );
+  }
+}
+
 function appendMessage(sender, msg, isFormatted = false) {
   const el = document.createElement("div");
   el.classList.add("message", sender);
@@ -240,10 +316,45 @@ function removeTyping() {
   if (typingEl) typingEl.remove();
 }
 
-function loadChatHistoryModal() {
-  chatHistoryContent.innerHTML = '<div class="loading-spinner"></div>';
+let historyCursor = null;
+let historyHasMore = false;
+let historyLoading = false;
+let historyQuery = "";
+
+function formatHistoryTime(isoString) {
+  return new Date(isoString).toLocaleString(undefined, {
+    month: "short",
+    day: "numeric",
+    year: "numeric",
+    hour: "numeric",
+    minute: "2-digit",
+  });
+}
+
+function renderHistoryPage(history) {
+  let html = "";
+  history.forEach((msg) => {
+    html += `
+      <div class="history-message">
+        <div class="history-user">You: ${msg.message}</div>
+        <div class="history-bot">Bot: ${formatBotResponse(msg.response)}</div>
+        <div class="history-time">${formatHistoryTime(msg.timestamp)}</div>
+      </div>`;
+  });
+  return html;
+}
 
-  fetch("/chat-history/", {
+function fetchHistoryPage() {
+  // Search results page by offset, plain history by timestamp cursor; both
+  // come back as { history, has_more, next_before } for the callers below.
+  const query = historyQuery;
+  const params = query
+    ? new URLSearchParams({ q: query, limit: 20 })
+    : new URLSearchParams({ limit: 50 });
+  if (historyCursor !== null) params.set(query ? "offset" : "before", historyCursor);
+  const url = query ? `/chat-history/search/?${params}` : `/chat-history/?${params}`;
+
+  return fetch(url, {
     method: "GET",
     headers: {
       "X-CSRFToken": csrftoken,
@@ -255,21 +366,64 @@ function loadChatHistoryModal() {
       }
       return res.json();
     })
+    .then((data) => {
+      if (query !== historyQuery) throw new Error("stale");
+      if (!query || !data.success) return data;
+      return {
+        success: true,
+        history: data.results,
+        has_more: data.has_more,
+        next_before: data.next_offset,
+      };
+    });
+}
+
+function loadMoreChatHistory() {
+  if (historyLoading || !historyHasMore) return;
+  historyLoading = true;
+  chatHistoryContent.insertAdjacentHTML(
+    "beforeend",
+    '<div class="loading-spinner" id="history-more-spinner"></div>'
+  );
+
+  fetchHistoryPage()
+    .then((data) => {
+      document.getElementById("history-more-spinner")?.remove();
+      if (!data.success) throw new Error(data.error);
+      chatHistoryContent.insertAdjacentHTML(
+        "beforeend",
+        renderHistoryPage(data.history)
+      );
+      historyCursor = data.next_before;
+      historyHasMore = data.has_more;
+    })
+    .catch((err) => {
+      document.getElementById("history-more-spinner")?.remove();
+      if (err.message === "stale") return;
+      console.error("Fetch Error:", err);
+      historyHasMore = false;
+    })
+    .finally(() => {
+      historyLoading = false;
+    });
+}
+
+function loadChatHistoryModal() {
+  chatHistoryContent.innerHTML = '<div class="loading-spinner"></div>';
+  historyCursor = null;
+  historyHasMore = false;
+  historyLoading = true;
+
+  fetchHistoryPage()
     .then((data) => {
       if (data.success) {
         if (data.history.length > 0) {
-          let html = "";
-          data.history.forEach((msg) => {
-            html += `
-              <div class="history-message">
-                <div class="history-user">You: ${msg.message}</div>
-                <div class="history-bot">Bot: ${formatBotResponse(
-                  msg.response
-                )}</div>
-                <div class="history-time">${msg.timestamp}</div>
-              </div>`;
-          });
-          chatHistoryContent.innerHTML = html;
+          chatHistoryContent.innerHTML = renderHistoryPage(data.history);
+          historyCursor = data.next_before;
+          historyHasMore = data.has_more;
+        } else if (historyQuery) {
+          chatHistoryContent.innerHTML =
+            '<div class="no-history">No messages match your search.</div>';
         } else {
           chatHistoryContent.innerHTML =
             '<div class="no-history">No chat history found. Start a conversation to see it here!</div>';
@@ -280,9 +434,13 @@ function loadChatHistoryModal() {
       }
     })
     .catch((err) => {
+      if (err.message === "stale") return;
       console.error("Fetch Error:", err);
       chatHistoryContent.innerHTML =
         '<div class="error">Failed to load chat history.</div>';
+    })
+    .finally(() => {
+      historyLoading = false;
     });
 }
 
@@ -0,0 +1,68 @@
+import asyncio
+import json
+import weakref
+
+import httpx
+from django.conf import settings
+
+from .upstream import RETRY_STATUSES, CircuitOpenError
+
+# httpx.AsyncClient is bound to the loop it first ran on, so keep one pooled
+# client per event loop rather than one per request.
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.GEMINI_STREAM_TIMEOUT, connect=settings.UPSTREAM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=settings.GEMINI_STREAM_MAX_CONNECTIONS, max_keepalive_connections=settings.GEMINI_STREAM_MAX_CONNECTIONS),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def stream_generate(upstream, url, contents):
+    """Yield the text chunks of a streamed generateContent call to ``url``.
+
+    ``upstream`` is the UpstreamClient whose circuit breaker guards the model.
+    """
+    data = {"contents": contents}
+    params = {'alt': 'sse', 'key': settings.GEMINI_API_KEY}
+    if not upstream.breaker.allow():
+        raise CircuitOpenError(f'{upstream.name} circuit is open')
+    recorded = False
+    try:
+        async with get_async_client().stream('POST', url, params=params, json=data) as response:
+            if response.status_code in RETRY_STATUSES:
+                upstream.breaker.record_failure()
+            else:
+                upstream.breaker.record_success()
+            recorded = True
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+                payload = json.loads(line[5:])
+                for candidate in payload.get('candidates', [])[:1]:
+                    for part in candidate.get('content', {}).get('parts', []):
+                        if part.get('text'):
+                            yield part['text']
+    except httpx.TransportError:
+        recorded = True
+        upstream.breaker.record_failure()
+        raise
+    finally:
+        # Cancelled before the headers arrived (a losing hedge, a client
+        # that went away): no outcome, but a half-open trial must not stay
+        # in flight forever.
+        if not recorded:
+            upstream.breaker.release_trial()
+
+
+def sse_event(data, event=None):
+    lines = [f'event: {event}'] if event else []
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
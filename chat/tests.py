@@ -1,3 +1,576 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import random
+import string
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from django.contrib.auth.models import AnonymousUser, User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import export, views
+from .account_deletion import schedule_deletion
+from .compression import MAGIC, TextCodec
+from .context import ContextBuilder
+from .intents import IntentRouter, TimeIntent, WeatherIntent
+from .mail_queue import dispatch_once, enqueue_mail
+from .matcher import ResponseMatcher
+from .ratelimit import client_ip, rate_limit_keys
+from .models import OTP, ArchivedChatMessage, ChatMessage, Conversation, OutboundEmail
+from .response_store import ResponseStore, parse_jsonl_responses
+from .search import search_messages
+from .streaming import stream_generate
+from .upstream import CircuitOpenError, UpstreamClient
+from .write_buffer import ChatMessageBuffer, chat_buffer, insert_messages, read_spool, replay_messages, save_chat_message
+
+# Background threads and the write-behind spool would outlive each test's
+# transaction, so tests write synchronously and leave mail and deletions
+# to explicit calls. Templates are rendered without a collectstatic manifest.
+TEST_SETTINGS = {
+    'STORAGES': {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+    'CHAT_WRITE_BEHIND': False,
+    'MAIL_QUEUE_MODE': 'command',
+    'ACCOUNT_DELETION_MODE': 'command',
+    'RATELIMIT_ENABLED': False,
+    'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+}
+
+
+def legacy_match(responses, message):
+    # The two-pass scan ResponseMatcher replaced.
+    for question, answer in responses.items():
+        if message == question:
+            return answer
+    for question, answer in responses.items():
+        if question in message:
+            return answer
+    return None
+
+
+class ResponseMatcherTests(TestCase):
+    def test_exact_match_beats_earlier_substring(self):
+        responses = {'hi': 'short', 'hi there': 'exact'}
+        self.assertEqual(ResponseMatcher(responses).match('hi there'), 'exact')
+
+    def test_first_question_in_source_order_wins(self):
+        # Overlapping questions: the automaton finds "he" and "she" inside
+        # "ushers" before "hers" ends, but "hers" comes first in the file.
+        responses = {'hers': 'hers', 'she': 'she', 'he': 'he'}
+        matcher = ResponseMatcher(responses)
+        for message in ('ushers', 'she said', 'he', 'the hero', 'nothing'):
+            self.assertEqual(matcher.match(message), legacy_match(responses, message), message)
+
+    def test_watcher_stops(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = ResponseStore(Path(directory) / 'responses.txt', reload_interval=60)
+            store.start_watching()
+            watcher = store._watcher
+            store.stop_watching(timeout=5)
+            self.assertFalse(watcher.is_alive())
+            store.start_watching()
+            self.assertTrue(store._watcher.is_alive())
+            store.stop_watching(timeout=5)
+
+    def test_empty_question_matches_everything_like_the_scan(self):
+        responses = {'bye': 'bye', '': 'fallback'}
+        self.assertEqual(ResponseMatcher(responses).match('goodbye'), legacy_match(responses, 'goodbye'))
+
+    def test_agrees_with_legacy_scan_on_random_corpus(self):
+        rng = random.Random(12)
+        words = [''.join(rng.choices('abcde', k=rng.randint(1, 3))) for _ in range(40)]
+        responses = {}
+        while len(responses) < 150:
+            responses[' '.join(rng.choices(words, k=rng.randint(1, 3)))] = f'answer {len(responses)}'
+        matcher = ResponseMatcher(responses)
+        questions = list(responses)
+        for _ in range(500):
+            message = ' '.join(rng.choices(words + questions, k=rng.randint(1, 6)))
+            self.assertEqual(matcher.match(message), legacy_match(responses, message), message)
+
+    def test_jsonl_priority_orders_substring_ties(self):
+        lines = [
+            '{"question": "python", "answer": "snake"}',
+            '{"question": "python code", "answer": "language", "aliases": ["py code"], "priority": 5}',
+            '# comments and broken lines are skipped',
+            'not json',
+        ]
+        matcher = ResponseMatcher(parse_jsonl_responses(lines))
+        self.assertEqual(matcher.match('show me python code'), 'language')
+        self.assertEqual(matcher.match('some py code'), 'language')
+        self.assertEqual(matcher.match('a python'), 'snake')
+
+
+@override_settings(**TEST_SETTINGS)
+class ChatHistoryPaginationTests(TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spool_dir.cleanup)
+        patcher = mock.patch.object(chat_buffer, 'spool_dir', Path(self.spool_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('pager', password='pager-pass-123')
+        other = User.objects.create_user('other')
+        now = timezone.now()
+        # Archived rows are older than every hot row; two share a timestamp
+        # so the id breaks the tie.
+        for number in range(5):
+            ArchivedChatMessage.objects.create(
+                id=number + 1, user=self.user, message=f'archived {number}', response='old',
+                timestamp=now - timedelta(days=100, minutes=number),
+            )
+        for number in range(4):
+            ChatMessage.objects.create(user=self.user, message=f'hot {number}', response='new', timestamp=now - timedelta(minutes=number // 2))
+        ChatMessage.objects.create(user=other, message='not mine', response='x', timestamp=now)
+        self.client.force_login(self.user)
+
+    def pages(self, limit):
+        params = {'limit': limit}
+        while True:
+            data = self.client.get('/chat-history/', params).json()
+            self.assertTrue(data['success'], data)
+            yield [row['message'] for row in data['history']]
+            if not data['has_more']:
+                self.assertIsNone(data['next_before'])
+                return
+            params['before'] = data['next_before']
+
+    def test_pages_walk_hot_rows_then_archive_without_gaps(self):
+        # Ties on timestamp come out newest id first.
+        expected = ['hot 1', 'hot 0', 'hot 3', 'hot 2'] + [f'archived {number}' for number in range(5)]
+        for limit in (1, 2, 3, 4, 9, 50):
+            pages = list(self.pages(limit))
+            messages = [message for page in pages for message in page]
+            self.assertEqual(messages, expected, f'limit={limit}')
+            self.assertTrue(all(0 < len(page) <= limit for page in pages))
+
+    def test_unflushed_messages_come_first(self):
+        chat_buffer.start()
+        self.addCleanup(chat_buffer.close)
+        with mock.patch.object(chat_buffer, 'flush_interval', 3600):
+            chat_buffer.add(self.user.id, None, 'still spooled', 'answer')
+            first = next(self.pages(2))
+        self.assertEqual(first, ['still spooled', 'hot 1'])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/chat-history/', {'before': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(**TEST_SETTINGS)
+class WriteBehindTests(TestCase):
+    def setUp(self):
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.buffer = ChatMessageBuffer(spool_dir.name, flush_interval=3600)
+        self.buffer.start()
+        self.addCleanup(self.buffer.close)
+        self.user = User.objects.create_user('writer')
+
+    def test_retry_after_a_partial_flush_does_not_duplicate_rows(self):
+        self.buffer.add(self.user.id, None, 'first', 'answer')
+        self.buffer.add(self.user.id, None, 'second', 'answer')
+
+        def insert_then_fail(records):
+            insert_messages(records[:1])
+            raise OSError('connection lost')
+
+        with mock.patch('chat.write_buffer.insert_messages', side_effect=insert_then_fail):
+            with self.assertRaises(OSError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(sorted(ChatMessage.objects.values_list('message', flat=True)), ['first', 'second'])
+        self.assertEqual(read_spool(self.buffer.spool_path), [])
+
+
+    def test_discard_rewrites_the_spool(self):
+        other = User.objects.create_user('stays')
+        self.buffer.add(self.user.id, None, 'forget me', 'answer')
+        self.buffer.add(other.id, None, 'keep me', 'answer')
+        self.buffer.discard(self.user.id)
+        self.assertEqual([record['message'] for record in read_spool(self.buffer.spool_path)], ['keep me'])
+        self.buffer.flush()
+        self.assertEqual(list(ChatMessage.objects.values_list('message', flat=True)), ['keep me'])
+
+    def test_rows_buffered_elsewhere_are_dropped_after_account_deletion(self):
+        # A row another worker (or a crashed one's spool) still holds.
+        record = {'user_id': self.user.id, 'conversation_id': None, 'message': 'old', 'response': 'answer', 'timestamp': timezone.now()}
+        schedule_deletion(self.user)
+        self.assertEqual(replay_messages([record]), 0)
+        self.assertEqual(insert_messages([record]), 0)
+        self.assertFalse(ChatMessage.objects.filter(user=self.user).exists())
+
+@override_settings(**TEST_SETTINGS, CHAT_EXPORT_CHUNK_SIZE=2)
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('exporter')
+        for number in range(5):
+            ChatMessage.objects.create(user=self.user, message=f'question {number}', response='answer')
+
+    def test_wsgi_export_streams_a_sync_iterator(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/chat-history/export/', {'format': 'ndjson'})
+        self.assertFalse(response.is_async)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['message'] for line in lines], [f'question {number}' for number in range(5)])
+
+    async def test_asgi_export_streams_chunk_by_chunk(self):
+        await self.async_client.aforce_login(self.user)
+        with mock.patch.object(export.buffered, '__defaults__', (1,)):
+            response = await self.async_client.get('/chat-history/export/', {'format': 'csv'})
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        # One chunk per CSV line: the header, then each message.
+        self.assertEqual(len(chunks), 6)
+        rows = list(csv.reader(b''.join(chunks).decode().splitlines()))
+        self.assertEqual([row[3] for row in rows], ['message'] + [f'question {number}' for number in range(5)])
+
+
+@override_settings(**TEST_SETTINGS)
+class OTPLookupTests(TestCase):
+    def test_signup_stores_lookup_columns_and_verification_uses_them(self):
+        self.client.post('/signup/', {'username': 'newbie', 'email': 'newbie@example.com', 'password1': 'pw-123456x', 'password2': 'pw-123456x'})
+        otp = OTP.objects.get()
+        self.assertEqual((otp.username, otp.email, otp.purpose), ('newbie', 'newbie@example.com', 'signup'))
+        self.assertEqual(OutboundEmail.objects.get().recipients, ['newbie@example.com'])
+
+        response = self.client.post('/otp-verification/', {'username': 'newbie', 'otp_code': otp.code})
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+        self.assertTrue(User.objects.filter(username='newbie', email='newbie@example.com').exists())
+        otp.refresh_from_db()
+        self.assertTrue(otp.is_used)
+
+    def test_wrong_and_expired_codes_are_refused(self):
+        otp = OTP.generate_otp({'username': 'late', 'email': 'late@example.com', 'password': 'pw-123456x'})
+        wrong = '000000' if otp.code != '000000' else '111111'
+        self.client.post('/otp-verification/', {'username': 'late', 'otp_code': wrong})
+        OTP.objects.filter(id=otp.id).update(created_at=timezone.now() - timedelta(minutes=11))
+        self.client.post('/otp-verification/', {'username': 'late', 'otp_code': otp.code})
+        self.assertFalse(User.objects.filter(username='late').exists())
+
+    def test_generate_replaces_codes_for_the_same_email_and_purpose(self):
+        OTP.generate_otp({'username': 'a', 'email': 'same@example.com'})
+        reset = OTP.generate_otp({'email': 'same@example.com', 'user_id': 1}, purpose='password_reset')
+        latest = OTP.generate_otp({'username': 'a', 'email': 'same@example.com'})
+        self.assertEqual(set(OTP.objects.values_list('id', flat=True)), {reset.id, latest.id})
+        self.assertEqual(reset.username, '')
+
+    def test_resend_finds_pending_code_by_username(self):
+        otp = OTP.generate_otp({'username': 'resender', 'email': 'resender@example.com'})
+        old_code = otp.code
+        for _ in range(5):
+            response = self.client.post('/resend-otp/', {'username': 'resender'}, content_type='application/json')
+            self.assertTrue(response.json()['success'])
+            otp.refresh_from_db()
+            if otp.code != old_code:
+                break
+        self.assertNotEqual(otp.code, old_code)
+        response = self.client.post('/resend-otp/', {'username': 'nobody'}, content_type='application/json')
+        self.assertFalse(response.json()['success'])
+
+
+@override_settings(**TEST_SETTINGS, MAIL_QUEUE_MAX_ATTEMPTS=3, MAIL_QUEUE_RETRY_DELAY=30, MAIL_QUEUE_LEASE=300)
+class OutboxTests(TestCase):
+    def test_queued_mail_is_sent_once(self):
+        email = enqueue_mail('Subject', 'Body', 'from@example.com', ['to@example.com'])
+        self.assertEqual(dispatch_once(), 1)
+        self.assertEqual(dispatch_once(), 0)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.SENT, 1))
+        self.assertIsNotNone(email.sent_at)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['to@example.com'])
+
+    def test_failures_back_off_exponentially_then_give_up(self):
+        email = enqueue_mail('Subject', 'Body', '', ['to@example.com'])
+        with mock.patch('chat.mail_queue.EmailMessage.send', side_effect=OSError('smtp down')):
+            for attempt, delay in ((1, 30), (2, 60)):
+                before = timezone.now()
+                self.assertEqual(dispatch_once(), 1)
+                email.refresh_from_db()
+                self.assertEqual((email.status, email.attempts, email.last_error), (OutboundEmail.PENDING, attempt, 'smtp down'))
+                self.assertGreaterEqual(email.next_attempt_at, before + timedelta(seconds=delay))
+                self.assertLess(email.next_attempt_at, before + timedelta(seconds=delay + 5))
+                # Not due yet, so nothing is claimed.
+                self.assertEqual(dispatch_once(), 0)
+                OutboundEmail.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+            self.assertEqual(dispatch_once(), 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.FAILED, 3))
+        self.assertEqual(dispatch_once(), 0)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_claimed_rows_are_leased(self):
+        email = enqueue_mail('Subject', 'Body', '', ['to@example.com'])
+        with mock.patch('chat.mail_queue.send_batch') as send_batch:
+            self.assertEqual(dispatch_once(), 1)
+        self.assertEqual(send_batch.call_args[0][0][0].id, email.id)
+        email.refresh_from_db()
+        # A worker that died mid-send leaves the row pending but out of reach until the lease ends.
+        self.assertEqual(email.status, OutboundEmail.PENDING)
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=250))
+        self.assertEqual(dispatch_once(), 0)
+
+
+class TextCodecTests(TestCase):
+    def test_round_trip(self):
+        codec = TextCodec(min_length=20, use_dictionary=False)
+        for text in ('', 'short', 'héllo wörld ' * 40, '\x00binary-ish\xff text ' * 10):
+            self.assertEqual(codec.decode(codec.encode(text)), text)
+
+    def test_short_and_incompressible_text_stays_raw(self):
+        codec = TextCodec(min_length=20, use_dictionary=False)
+        self.assertEqual(codec.encode('short'), b'short')
+        noise = ''.join(random.Random(3).choices(string.printable, k=40))
+        self.assertEqual(codec.encode(noise), noise.encode())
+        self.assertEqual(codec.encode('repeat ' * 50)[0], MAGIC)
+
+    def test_dictionary_id_is_stored_in_the_header(self):
+        dictionary = b'the quick brown fox jumps over the lazy dog'
+        codec = TextCodec(min_length=20, dictionary=(7, dictionary))
+        encoded = codec.encode('the quick brown fox jumps over the lazy dog, again and again')
+        self.assertEqual(encoded[:3], bytes((MAGIC, 1, 7)))
+        self.assertEqual(TextCodec(dictionary=(7, dictionary)).decode(encoded), 'the quick brown fox jumps over the lazy dog, again and again')
+
+
+class CompressionMigrationTests(TransactionTestCase):
+    before = [('chat', '0008_chatmessage_search_index')]
+    after = [('chat', '0009_compressed_text')]
+    long_text = 'Compressed chat answers read back unchanged. ' * 20
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def stored(self, table, column, row_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {column} FROM {table} WHERE id = %s', [row_id])
+            return cursor.fetchone()[0]
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_rows_survive_compression_and_back(self):
+        apps = self.migrate(self.before)
+        user = apps.get_model('auth', 'User').objects.create(username='migrated')
+        message = apps.get_model('chat', 'ChatMessage').objects.create(user_id=user.id, message='Why do answers come back unchanged?', response=self.long_text, timestamp=timezone.now())
+        archived = apps.get_model('chat', 'ArchivedChatMessage').objects.create(id=10 ** 6, user_id=user.id, message=self.long_text, response=self.long_text, timestamp=timezone.now())
+
+        self.migrate(self.after)
+        self.assertEqual(bytes(self.stored('chat_chatmessage', 'response', message.id))[0], MAGIC)
+        self.assertEqual(bytes(self.stored('chat_archivedchatmessage', 'response', archived.id))[0], MAGIC)
+        # Questions stay plain text for the search index.
+        self.assertEqual(self.stored('chat_chatmessage', 'message', message.id), 'Why do answers come back unchanged?')
+        self.assertEqual(self.stored('chat_archivedchatmessage', 'message', archived.id), self.long_text)
+        self.assertEqual(ChatMessage.objects.get(id=message.id).response, self.long_text)
+        self.assertEqual(ArchivedChatMessage.objects.get(id=archived.id).response, self.long_text)
+        self.assertEqual([row['id'] for row in search_messages(user.id, 'unchanged', 5)], [message.id])
+
+        self.migrate(self.before)
+        self.assertEqual(self.stored('chat_chatmessage', 'response', message.id), self.long_text)
+        self.assertEqual(self.stored('chat_archivedchatmessage', 'response', archived.id), self.long_text)
+
+
+@override_settings(**TEST_SETTINGS)
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('searcher')
+        self.other = User.objects.create_user('someone-else')
+
+    def test_questions_are_indexed_and_deletes_follow(self):
+        save_chat_message(self.user, None, 'How do I sort a list?', 'Use sorted() with a key function. ' * 30)
+        save_chat_message(self.other, None, 'sort my list', 'private')
+        results = search_messages(self.user.id, 'sorted list', 10)
+        self.assertEqual([row['message'] for row in results], ['How do I sort a list?'])
+        self.assertEqual(results[0]['response'], 'Use sorted() with a key function. ' * 30)
+        self.assertIn('list', results[0]['snippet'])
+        # Answers are stored compressed and are not searched.
+        self.assertEqual(search_messages(self.user.id, 'function', 10), [])
+        ChatMessage.objects.filter(user=self.user).delete()
+        self.assertEqual(search_messages(self.user.id, 'sorted', 10), [])
+
+    def test_fts_syntax_in_queries_is_quoted(self):
+        save_chat_message(self.user, None, 'what does NEAR mean', 'an operator')
+        self.assertEqual(len(search_messages(self.user.id, 'NEAR( "mean', 10)), 1)
+
+
+class IntentRoutingTests(TestCase):
+    def setUp(self):
+        self.lookups = []
+
+        def get_weather(city, explicit):
+            self.lookups.append((city, explicit))
+            if city in ('Atlantis', 'Nowhere Land'):
+                return f'Could not find weather information for {city}.' if explicit else None
+            return f'Weather in {city}'
+
+        self.router = IntentRouter([WeatherIntent(get_weather), TimeIntent()])
+
+    def test_time_only_answers_time_questions(self):
+        for message in ('What time is it?', "what's the date today", 'current time', 'what is the time in Tokyo?'):
+            self.assertEqual(self.router.route(message).intent, 'time', message)
+        for message in ('What is the time complexity of quicksort?', 'what is the date of the french revolution', 'what is the day after tomorrow'):
+            self.assertIsNone(self.router.route(message), message)
+
+    def test_weather_city_after_a_preposition(self):
+        self.assertEqual(self.router.route('weather in London tomorrow').answer, 'Weather in London')
+        self.assertEqual(self.router.route('weather in Atlantis').answer, 'Could not find weather information for Atlantis.')
+        self.assertIn('specify a city', self.router.route("What's the weather?").answer)
+        self.assertEqual(self.lookups, [('London', True), ('Atlantis', True)])
+
+    def test_weather_city_without_a_preposition(self):
+        self.assertEqual(self.router.route('weather London tomorrow').answer, 'Weather in London')
+        self.assertEqual(self.router.route('New York forecast today').answer, 'Weather in New York')
+        # A guessed city the lookup does not know goes to the LLM.
+        self.assertIsNone(self.router.route('weather Nowhere Land'))
+        for message in ('Write a poem about the weather', 'why does the weather change so fast in spring and autumn every year'):
+            self.assertIsNone(self.router.route(message), message)
+        self.assertEqual(self.lookups, [('London', False), ('New York', False), ('Nowhere Land', False)])
+
+
+class CircuitBreakerTrialTests(TestCase):
+    def half_open_client(self):
+        upstream = UpstreamClient('test', 'http://upstream.invalid', failure_threshold=1, reset_timeout=0)
+        upstream.breaker.record_failure()
+        return upstream
+
+    def test_cancelled_stream_releases_the_trial(self):
+        upstream = self.half_open_client()
+
+        async def never_answers(request):
+            await asyncio.Event().wait()
+
+        async def cancel_before_headers():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(never_answers))
+            with mock.patch('chat.streaming.get_async_client', return_value=client):
+                task = asyncio.create_task(anext(stream_generate(upstream, 'http://upstream.invalid/stream', [])))
+                await asyncio.sleep(0.01)
+                self.assertFalse(upstream.breaker.allow())
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+            await client.aclose()
+
+        asyncio.run(cancel_before_headers())
+        self.assertTrue(upstream.breaker.is_open)
+        self.assertTrue(upstream.breaker.allow())
+
+    def test_interrupted_sync_call_releases_the_trial(self):
+        upstream = self.half_open_client()
+        with mock.patch.object(upstream.session, 'request', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                upstream.get('/')
+        self.assertTrue(upstream.breaker.allow())
+
+
+class WeatherLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def lookup(self, city, explicit=True, payload=None, error=None):
+        response = mock.Mock(json=mock.Mock(return_value=payload))
+        with mock.patch.object(views.OPENWEATHER, 'get', return_value=response, side_effect=error):
+            return views.get_weather(city, explicit)
+
+    def test_report_and_unknown_city(self):
+        payload = {'cod': 200, 'weather': [{'description': 'clear sky'}], 'main': {'temp': 21, 'humidity': 40}, 'wind': {'speed': 3}}
+        self.assertEqual(self.lookup('Paris', payload=payload), 'Weather in Paris: clear sky, Temperature: 21°C, Humidity: 40%, Wind: 3 m/s')
+        missing = {'cod': '404', 'message': 'city not found'}
+        self.assertEqual(self.lookup('Atlantis', payload=missing), 'Could not find weather information for Atlantis.')
+        self.assertIsNone(self.lookup('Nowhere Land', explicit=False, payload=missing))
+
+    def test_upstream_errors_get_the_apology(self):
+        apology = "Sorry, I'm having trouble getting weather information right now."
+        self.assertEqual(self.lookup('Rome', payload={'cod': 401, 'message': 'Invalid API key'}), apology)
+        self.assertEqual(self.lookup('Rome', explicit=False, error=CircuitOpenError('openweather circuit is open')), apology)
+        self.assertEqual(self.lookup('Rome', error=ValueError('not json')), apology)
+
+
+@override_settings(**TEST_SETTINGS, METRICS_TOKEN='scrape-me', METRICS_PUBLIC=False)
+class MetricsAccessTests(TestCase):
+    def test_denied_without_token_or_staff(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.client.force_login(User.objects.create_user('plain'))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    def test_token_staff_and_opt_in(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me').status_code, 200)
+        with self.settings(METRICS_PUBLIC=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+@override_settings(**TEST_SETTINGS)
+class ContextWindowTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('talker')
+        self.conversation = Conversation.objects.create(user=self.user)
+        self.builder = ContextBuilder(max_turns=3, cache_ttl=0, exclude_responses=['error'])
+
+    def turns(self):
+        return self.builder.window(Conversation.objects.get(id=self.conversation.id))['turns']
+
+    def test_uncached_window_sees_turns_from_other_workers(self):
+        self.assertEqual(self.turns(), [])
+        ChatMessage.objects.create(user=self.user, conversation=self.conversation, message='one', response='first')
+        ChatMessage.objects.create(user=self.user, conversation=self.conversation, message='two', response='second')
+        unflushed = {'user_id': self.user.id, 'conversation_id': self.conversation.id, 'message': 'three', 'response': 'third', 'timestamp': timezone.now()}
+        with mock.patch.object(chat_buffer, 'pending_for', return_value=[unflushed]):
+            self.assertEqual(self.turns(), [['one', 'first'], ['two', 'second'], ['three', 'third']])
+
+    def test_error_replies_are_not_turns(self):
+        self.builder.record(self.conversation, 'hello', 'error')
+        ChatMessage.objects.create(user=self.user, conversation=self.conversation, message='hello', response='error')
+        ChatMessage.objects.create(user=self.user, conversation=self.conversation, message='hi', response='hey')
+        self.assertEqual(self.turns(), [['hi', 'hey']])
+        self.assertEqual(Conversation.objects.get(id=self.conversation.id).summary, '')
+
+
+class RateLimitKeyTests(TestCase):
+    def request(self, user, **meta):
+        request = RequestFactory().post('/', REMOTE_ADDR='10.0.0.1', **meta)
+        request.user = user
+        return request
+
+    def test_logged_in_users_do_not_share_the_proxy_address(self):
+        first, second = User.objects.create_user('first'), User.objects.create_user('second')
+        self.assertEqual(rate_limit_keys('chat', self.request(first)), [f'ratelimit:chat:user:{first.pk}'])
+        self.assertNotEqual(rate_limit_keys('chat', self.request(first)), rate_limit_keys('chat', self.request(second)))
+        self.assertEqual(rate_limit_keys('otp', self.request(AnonymousUser())), ['ratelimit:otp:ip:10.0.0.1'])
+
+    def test_forwarded_for_counts_back_past_trusted_proxies(self):
+        request = self.request(AnonymousUser(), HTTP_X_FORWARDED_FOR='6.6.6.6, 1.2.3.4')
+        with self.settings(RATELIMIT_TRUST_FORWARDED_FOR=False):
+            self.assertEqual(client_ip(request), '10.0.0.1')
+        with self.settings(RATELIMIT_TRUST_FORWARDED_FOR=True, RATELIMIT_PROXY_COUNT=1):
+            self.assertEqual(client_ip(request), '1.2.3.4')
+        with self.settings(RATELIMIT_TRUST_FORWARDED_FOR=True, RATELIMIT_PROXY_COUNT=3):
+            self.assertEqual(client_ip(request), '6.6.6.6')
+
+
+@override_settings(**TEST_SETTINGS)
+class PurgeAccountsTests(TestCase):
+    def test_inactive_accounts_need_confirmation(self):
+        User.objects.create_user('deactivated', is_active=False)
+        with self.assertRaisesMessage(CommandError, 'deactivated'):
+            call_command('purge_accounts', inactive=True, stdout=mock.MagicMock())
+        self.assertTrue(User.objects.filter(username='deactivated').exists())
+        call_command('purge_accounts', inactive=True, yes=True, stdout=mock.MagicMock())
+        self.assertFalse(User.objects.filter(username='deactivated').exists())
@@ -0,0 +1,107 @@
+import copy
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+
+
+class TTLCache:
+    """Small thread-safe in-process cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                now = time.monotonic()
+                self._entries = {key: entry for key, entry in self._entries.items() if entry[0] >= now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+users = TTLCache(settings.USER_CACHE_TTL, settings.USER_CACHE_MAX_ENTRIES)
+
+
+def version_key(user_id):
+    return f'user-version:{user_id}'
+
+
+def current_version(user_id):
+    # Without a shared cache other workers cannot be told about changes;
+    # their copies expire after USER_CACHE_TTL instead.
+    if not settings.SHARED_CACHE:
+        return ''
+    return caches['default'].get(version_key(user_id), '')
+
+
+def get_user(request):
+    """auth.get_user() with the User row served from the per-process cache.
+
+    The cached user is only used when the session's auth hash still matches
+    it, so a session created after a password change in another worker
+    falls through to the database instead of being flushed. With a shared
+    cache, it must also carry the user's current version, which
+    invalidate_user() replaces.
+    """
+    session = request.session
+    user_id = session.get(SESSION_KEY)
+    version = None
+    if users.ttl > 0 and user_id is not None and session.get(BACKEND_SESSION_KEY) in settings.AUTHENTICATION_BACKENDS:
+        version = current_version(user_id)
+        entry = users.get(str(user_id))
+        if entry is not None and entry[0] == version:
+            user = entry[1]
+            if constant_time_compare(session.get(HASH_SESSION_KEY, ''), user.get_session_auth_hash()):
+                # Views may modify request.user, so each request gets its own copy.
+                return copy.copy(user)
+    user = auth.get_user(request)
+    if user.is_authenticated and version is not None:
+        # The version read before the database is stored, so a change made
+        # in between makes this entry stale rather than the change lost.
+        users.set(str(user.pk), (version, copy.copy(user)))
+    return user
+
+
+def invalidate_user(user_id):
+    users.delete(str(user_id))
+    if settings.SHARED_CACHE:
+        caches['default'].set(version_key(user_id), uuid.uuid4().hex, None)
+
+
+def user_saved(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+def user_logged_out(sender, request, user, **kwargs):
+    if user is not None:
+        invalidate_user(user.pk)
@@ -2,88 +2,171 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.csrf import csrf_protect
+from django.middleware.csrf import get_token
 from django.utils import timezone
 from django.db import transaction
-from django.core.mail import send_mail
+from django.db.models import Q
 from django.conf import settings
+from asgiref.sync import sync_to_async
+import hmac
 import json
-import google.generativeai as genai
-from .models import ChatMessage, OTP
+from datetime import datetime, timezone as dt_timezone
+from .mail_queue import enqueue_mail
+from .ratelimit import ConcurrencyLimiter, Overloaded, rate_limit
+from .metrics import timed, timed_upstream
+from . import metrics
+from .account_deletion import schedule_deletion
+from .compression import codec, raw_text
+from .context import ContextBuilder, user_part
+from .export import EXPORT_FORMATS, aiter_chunks, export_chunks
+from .intents import CalculatorIntent, IntentRouter, TimeIntent, UnitConversionIntent, WeatherIntent
+from .llm import LLM
+from .models import ArchivedChatMessage, ChatMessage, Conversation, OTP
+from .page_cache import PageCache
+from .response_cache import ResponseCache
+from .response_store import ResponseStore
+from .search import search_messages
+from .streaming import sse_event
+from .user_cache import invalidate_user
+from .upstream import OPENWEATHER
+from .weather_cache import WeatherCache
+from .write_buffer import chat_buffer, save_chat_message
 import random
 import string
-import requests
-import re
 
-genai.configure(api_key=settings.GEMINI_API_KEY)
+GEMINI_ERROR_MESSAGE = "I'm having trouble processing your request right now. Please try again in a moment."
 
-def load_custom_responses():
-    custom_responses = {}
-    try:
-        with open('responses.txt', 'r') as file:
-            for line in file:
-                if ':' in line:
-                    question, answer = line.strip().split(':', 1)
-                    custom_responses[question.lower().strip()] = answer.strip()
-    except FileNotFoundError:
-        pass
-    return custom_responses
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+# Buffered rows have no id yet; this sorts them after every stored row.
+UNFLUSHED_ID = 2 ** 63 - 1
+
+RESPONSE_STORE = ResponseStore(settings.CUSTOM_RESPONSES_FILE, settings.CUSTOM_RESPONSES_RELOAD_INTERVAL)
 
-CUSTOM_RESPONSES = load_custom_responses()
+PAGE_CACHE = PageCache(settings.PAGE_CACHE_MAX_ENTRIES, settings.PAGE_CACHE_ENABLED)
 
 def landing_page(request):
-    return render(request, 'chat/landing.html')
+    return PAGE_CACHE.respond(request, 'chat/landing.html', request.user.is_authenticated)
 
 def chat_page(request):
-    return render(request, 'chat/chat_interface.html')
+    user = request.user
+    # The page itself has no CSRF token; the chat script reads it from the cookie.
+    get_token(request)
+    variant = (user.pk, user.username, user.email) if user.is_authenticated else None
+    return PAGE_CACHE.respond(request, 'chat/chat_interface.html', variant)
+
+def fetch_weather(city):
+    params = {'q': city, 'appid': settings.OPENWEATHER_API_KEY, 'units': 'metric'}
+    with timed_upstream('openweather'):
+        response = OPENWEATHER.get('/data/2.5/weather', params=params)
+    data = response.json()
+    if data['cod'] == 200:
+        weather = data['weather'][0]['description']
+        temp = data['main']['temp']
+        humidity = data['main']['humidity']
+        wind = data['wind']['speed']
+        return f"Weather in {city}: {weather}, Temperature: {temp}°C, Humidity: {humidity}%, Wind: {wind} m/s"
+    if str(data['cod']) == '404':
+        return None
+    # Bad keys and upstream errors are not cached as unknown cities.
+    raise ValueError(f"OpenWeather error {data['cod']}: {data.get('message', '')}")
 
-def get_weather(city):
+WEATHER_CACHE = WeatherCache(fetch_weather, settings.WEATHER_CACHE_TTL, settings.WEATHER_CACHE_NEGATIVE_TTL)
+
+def get_weather(city, explicit=True):
+    # A city guessed without "in/at/for" that OpenWeather does not know was
+    # probably not a city; None hands the message on to the LLM.
     try:
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={settings.OPENWEATHER_API_KEY}&units=metric"
-        response = requests.get(url)
-        data = response.json()
-        if data['cod'] == 200:
-            weather = data['weather'][0]['description']
-            temp = data['main']['temp']
-            humidity = data['main']['humidity']
-            wind = data['wind']['speed']
-            return f"Weather in {city}: {weather}, Temperature: {temp}°C, Humidity: {humidity}%, Wind: {wind} m/s"
-        else:
-            return f"Could not find weather information for {city}."
+        report = WEATHER_CACHE.get(city)
     except Exception:
         return "Sorry, I'm having trouble getting weather information right now."
+    if report is not None:
+        return report
+    if not explicit:
+        return None
+    return f"Could not find weather information for {city}."
+
+RESPONSE_CACHE = ResponseCache(settings.LLM_CACHE_TTL, similarity_threshold=settings.LLM_SIMILARITY_THRESHOLD, similarity_max_entries=settings.LLM_SIMILARITY_MAX_ENTRIES)
+
+def cache_stats():
+    yield 'chat_response_cache_lookups_total', 'counter', 'Gemini response cache lookups.', ['result'], {(name,): value for name, value in RESPONSE_CACHE.stats.items()}
+    yield 'chat_weather_cache_lookups_total', 'counter', 'Weather cache lookups.', ['result'], {(name,): value for name, value in WEATHER_CACHE.stats.items()}
+
+metrics.registry.add_collector(cache_stats)
+
+INTENT_ROUTER = IntentRouter([WeatherIntent(get_weather), TimeIntent(), UnitConversionIntent(), CalculatorIntent()])
+
+def get_local_response(message):
+    message_lower = message.lower().strip()
+    with timed('custom_match'):
+        custom_answer = RESPONSE_STORE.match(message_lower)
+    if custom_answer is not None:
+        metrics.answers.inc(source='custom')
+        return custom_answer
+    with timed('intent_router'):
+        route = INTENT_ROUTER.route(message)
+    if route is not None:
+        metrics.answers.inc(source=route.intent)
+        return route.answer
+    return None
+
+CONTEXT_BUILDER = ContextBuilder(
+    settings.CONTEXT_MAX_TURNS, settings.CONTEXT_TOKEN_BUDGET, settings.CONTEXT_SUMMARY_MAX_TOKENS, settings.CONTEXT_CACHE_TTL,
+    exclude_responses=[GEMINI_ERROR_MESSAGE],
+)
 
-def get_gemini_response(message):
+GEMINI_LIMITER = ConcurrencyLimiter(settings.GEMINI_MAX_IN_FLIGHT, settings.GEMINI_MAX_QUEUE, settings.GEMINI_QUEUE_TIMEOUT)
+
+BUSY_MESSAGE = 'The assistant is busy right now. Please try again in a moment.'
+
+def service_busy():
+    response = JsonResponse({'error': BUSY_MESSAGE}, status=503)
+    response['Retry-After'] = '1'
+    return response
+
+def get_conversation(user, conversation_id):
+    if conversation_id:
+        return Conversation.objects.get(id=conversation_id, user=user)
+    return Conversation.objects.create(user=user)
+
+def start_turn(user, conversation_id, message):
+    conversation = get_conversation(user, conversation_id)
+    return conversation, CONTEXT_BUILDER.build(conversation, message)
+
+def get_gemini_response(message, contents=None):
     try:
-        message_lower = message.lower().strip()
-        for question, answer in CUSTOM_RESPONSES.items():
-            if message_lower == question:
-                return answer
-        for question, answer in CUSTOM_RESPONSES.items():
-            if question in message_lower:
-                return answer
-        weather_match = re.search(r'weather|temperature|forecast|humidity|wind', message_lower)
-        if weather_match:
-            city_match = re.search(r'(?:in|at|for)\s+([a-zA-Z\s]+)$', message_lower)
-            if city_match:
-                city = city_match.group(1).strip()
-                return get_weather(city)
-            else:
-                return "Please specify a city for weather information. For example: 'weather in London'"
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={settings.GEMINI_API_KEY}"
-        headers = {'Content-Type': 'application/json'}
-        data = {"contents": [{"parts": [{"text": message}]}]}
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        response_data = response.json()
-        return response_data['candidates'][0]['content']['parts'][0]['text']
+        local_response = get_local_response(message)
+        if local_response is not None:
+            return local_response
+        contents = contents or [user_part(message)]
+        # Follow-up questions depend on earlier turns, so only standalone
+        # prompts are served from or stored in the response cache.
+        use_cache = len(contents) == 1
+        cached_response = RESPONSE_CACHE.get(message) if use_cache else None
+        if cached_response is not None:
+            metrics.answers.inc(source='cache')
+            return cached_response
+        with GEMINI_LIMITER, timed('llm'):
+            text = LLM.generate(contents)
+        if use_cache:
+            RESPONSE_CACHE.set(message, text)
+        metrics.answers.inc(source='llm')
+        return text
+    except Overloaded:
+        raise
     except Exception:
-        return "I'm having trouble processing your request right now. Please try again in a moment."
+        metrics.answers.inc(source='error')
+        return GEMINI_ERROR_MESSAGE
 
 @csrf_exempt
 @login_required
+@rate_limit('chat', settings.CHAT_RATE_LIMIT)
 def chatbot_api(request):
     if request.method == 'POST':
         try:
@@ -91,15 +174,100 @@ def chatbot_api(request):
             user_message = data.get('message', '')
             if not user_message or len(user_message.strip()) == 0:
                 return JsonResponse({'error': 'Message cannot be empty'}, status=400)
-            bot_response = get_gemini_response(user_message)
-            chat_message = ChatMessage(user=request.user, message=user_message, response=bot_response)
-            chat_message.save()
-            return JsonResponse({'success': True, 'response': bot_response})
+            try:
+                conversation, contents = start_turn(request.user, data.get('conversation_id'), user_message)
+            except (Conversation.DoesNotExist, ValueError):
+                return JsonResponse({'error': 'Conversation not found'}, status=404)
+            bot_response = get_gemini_response(user_message, contents)
+            CONTEXT_BUILDER.record(conversation, user_message, bot_response)
+            with timed('db_write'):
+                save_chat_message(request.user, conversation, user_message, bot_response)
+            with timed('json_encode'):
+                return JsonResponse({'success': True, 'response': bot_response, 'conversation_id': conversation.id})
+        except Overloaded:
+            return service_busy()
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
 @csrf_exempt
+@login_required
+@rate_limit('chat', settings.CHAT_RATE_LIMIT)
+async def chatbot_stream_api(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    user_message = data.get('message', '')
+    if not user_message or len(user_message.strip()) == 0:
+        return JsonResponse({'error': 'Message cannot be empty'}, status=400)
+    user = await request.auser()
+    try:
+        conversation, contents = await sync_to_async(start_turn)(user, data.get('conversation_id'), user_message)
+    except (Conversation.DoesNotExist, ValueError):
+        return JsonResponse({'error': 'Conversation not found'}, status=404)
+    use_cache = len(contents) == 1
+    try:
+        local_response = await sync_to_async(get_local_response)(user_message)
+        if local_response is None and use_cache:
+            local_response = await sync_to_async(RESPONSE_CACHE.get)(user_message)
+            if local_response is not None:
+                metrics.answers.inc(source='cache')
+    except Exception:
+        local_response = GEMINI_ERROR_MESSAGE
+
+    async def event_stream():
+        # The limiter slot is taken inside the generator so that it is always
+        # released by the finally below, even if the client goes away.
+        if local_response is None and not await GEMINI_LIMITER.aacquire():
+            yield sse_event({'error': BUSY_MESSAGE}, event='busy')
+            return
+        chunks = []
+        try:
+            if local_response is not None:
+                chunks.append(local_response)
+                yield sse_event({'text': local_response})
+            else:
+                with timed('llm_stream'):
+                    async for text in LLM.stream(contents):
+                        chunks.append(text)
+                        yield sse_event({'text': text})
+                if use_cache:
+                    await sync_to_async(RESPONSE_CACHE.set)(user_message, ''.join(chunks))
+                metrics.answers.inc(source='llm')
+        except Exception:
+            metrics.answers.inc(source='error')
+            if not chunks:
+                chunks.append(GEMINI_ERROR_MESSAGE)
+                yield sse_event({'text': GEMINI_ERROR_MESSAGE})
+        finally:
+            if local_response is None:
+                GEMINI_LIMITER.release()
+        bot_response = ''.join(chunks)
+        await sync_to_async(CONTEXT_BUILDER.record)(conversation, user_message, bot_response)
+        await sync_to_async(save_chat_message)(user, conversation, user_message, bot_response)
+        yield sse_event({'success': True, 'conversation_id': conversation.id}, event='done')
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def metrics_allowed(request):
+    if settings.METRICS_PUBLIC or request.user.is_staff:
+        return True
+    token = settings.METRICS_TOKEN
+    return bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@csrf_exempt
+@rate_limit('otp', settings.OTP_RATE_LIMIT)
 def signup(request):
     if request.user.is_authenticated:
         return JsonResponse({'success': True, 'redirect': '/'}) if request.headers.get('X-Requested-With') == 'XMLHttpRequest' else redirect('/')
@@ -122,12 +290,11 @@ def signup(request):
         try:
             user_data = {'username': username, 'email': email, 'password': password1}
             otp = OTP.generate_otp(user_data)
-            send_mail(
+            enqueue_mail(
                 'Your ChatBot Verification Code',
                 f'Your OTP code is: {otp.code}. It will expire in 10 minutes.',
                 settings.DEFAULT_FROM_EMAIL,
                 [email],
-                fail_silently=False,
             )
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({'success': True, 'redirect': f'/otp-verification/?username={username}'})
@@ -169,40 +336,129 @@ def logout_view(request):
 def delete_account(request):
     if request.method == 'POST':
         try:
-            ChatMessage.objects.filter(user=request.user).delete()
-            request.user.delete()
+            # The deletion job is recorded first: other workers' buffers
+            # skip the user's rows once it exists.
+            schedule_deletion(request.user)
+            chat_buffer.discard(request.user.id)
+            invalidate_user(request.user.id)
             logout(request)
             return JsonResponse({'success': True})
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
     return JsonResponse({'success': False, 'error': 'Invalid request method'})
 
+def parse_history_cursor(cursor):
+    timestamp, _, message_id = cursor.rpartition(',')
+    parsed = datetime.fromisoformat(timestamp)
+    if parsed.tzinfo is None and settings.USE_TZ:
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed, int(message_id)
+
+def history_cursor(row):
+    return f"{row['timestamp'].isoformat()},{row['id']}"
+
+def merge_unflushed(user, rows, cursor):
+    # Read-your-writes for messages still in the write-behind buffer. A row
+    # can be in both places for the moment between insert and buffer clear.
+    stored = {(row['timestamp'], row['message']) for row in rows}
+    unflushed = [
+        {'id': UNFLUSHED_ID, 'message': record['message'], 'raw_response': record['response'], 'timestamp': record['timestamp']}
+        for record in chat_buffer.pending_for(user.id)
+        if (record['timestamp'], record['message']) not in stored
+    ]
+    if cursor:
+        unflushed = [row for row in unflushed if (row['timestamp'], row['id']) < cursor]
+    if not unflushed:
+        return rows
+    return sorted(rows + unflushed, key=lambda row: (row['timestamp'], row['id']), reverse=True)
+
 @login_required
 def chat_history(request):
     try:
-        messages = ChatMessage.objects.filter(user=request.user).order_by('timestamp')
-        history = [{'message': msg.message, 'response': msg.response, 'timestamp': msg.timestamp.strftime('%b %d, %Y %I:%M %p')} for msg in messages]
-        return JsonResponse({'success': True, 'history': history})
+        limit = min(max(int(request.GET.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+        page_filter = Q(user=request.user)
+        cursor = None
+        before = request.GET.get('before')
+        if before:
+            cursor = timestamp, message_id = parse_history_cursor(before)
+            page_filter &= Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid pagination parameters'}, status=400)
+    try:
+        # Responses are read as stored and only the ones on the page are decompressed.
+        fields = ('id', 'message', 'timestamp')
+        rows = list(ChatMessage.objects.filter(page_filter).order_by('-timestamp', '-id').values(*fields, raw_response=raw_text('response'))[:limit + 1])
+        rows = merge_unflushed(request.user, rows, cursor)
+        if len(rows) <= limit:
+            # Archived rows are all older than the hot table, so they only
+            # come into play once the hot table runs out for this cursor.
+            archived = ArchivedChatMessage.objects.filter(page_filter)
+            rows += archived.order_by('-timestamp', '-id').values(*fields, raw_response=raw_text('response'))[:limit + 1 - len(rows)]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        history = [{'message': row['message'], 'response': codec.decode(row['raw_response']), 'timestamp': row['timestamp'].isoformat()} for row in rows]
+        next_before = history_cursor(rows[-1]) if has_more else None
+        return JsonResponse({'success': True, 'history': history, 'has_more': has_more, 'next_before': next_before})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
+@login_required
+def chat_history_search(request):
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'success': False, 'error': 'Search query cannot be empty'}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE_SIZE)
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid pagination parameters'}, status=400)
+    try:
+        with timed('search'):
+            rows = search_messages(request.user.id, query, limit, offset)
+        has_more = len(rows) > limit
+        results = [
+            {'message': row['message'], 'response': row['response'], 'timestamp': row['timestamp'].isoformat(), 'snippet': row['snippet'], 'score': row['score']}
+            for row in rows[:limit]
+        ]
+        return JsonResponse({'success': True, 'results': results, 'has_more': has_more, 'next_offset': offset + limit if has_more else None})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@login_required
+@rate_limit('export', settings.CHAT_EXPORT_RATE_LIMIT, methods=('GET',))
+def export_chat_history(request):
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'success': False, 'error': 'Unsupported export format'}, status=400)
+    compress = request.GET.get('gzip') in ('1', 'true')
+    _, content_type, extension = EXPORT_FORMATS[export_format]
+    filename = f'chat-history-{timezone.now():%Y-%m-%d}.{extension}'
+    if compress:
+        content_type, filename = 'application/gzip', filename + '.gz'
+    chunks = export_chunks(request.user.id, export_format, compress, settings.CHAT_EXPORT_CHUNK_SIZE)
+    if isinstance(request, ASGIRequest):
+        chunks = aiter_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @csrf_exempt
+@rate_limit('otp', settings.OTP_RATE_LIMIT)
 def resend_otp(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
             username = data.get('username')
-            otp = OTP.objects.filter(user_data__username=username, is_used=False).first()
+            otp = OTP.objects.filter(username=username, purpose='signup', is_used=False).first()
             if otp:
                 otp.code = ''.join(random.choices(string.digits, k=6))
                 otp.created_at = timezone.now()
                 otp.save()
-                send_mail(
+                enqueue_mail(
                     'Your ChatBot Verification Code',
                     f'Your new OTP code is: {otp.code}. It will expire in 10 minutes.',
                     settings.DEFAULT_FROM_EMAIL,
-                    [otp.user_data['email']],
-                    fail_silently=False,
+                    [otp.email],
                 )
                 return JsonResponse({'success': True})
             return JsonResponse({'success': False, 'error': 'No pending verification found'})
@@ -217,7 +473,7 @@ def otp_verification(request):
     if request.method == 'POST':
         username = request.POST.get('username')
         otp_code = request.POST.get('otp_code')
-        otp = OTP.objects.filter(user_data__username=username, code=otp_code, is_used=False).first()
+        otp = OTP.objects.filter(username=username, code=otp_code, purpose='signup', is_used=False).first()
         if otp and otp.is_valid():
             try:
                 with transaction.atomic():
@@ -253,22 +509,23 @@ def contact_form_submission(request):
                 return JsonResponse({'success': False, 'message': 'All fields are required'})
             subject = f"New Contact Form Message from {name}"
             email_message = f"Name: {name}\nEmail: {email}\nMessage: {message}\nThis message was sent from the ChatBot contact form."
-            send_mail(subject, email_message, settings.DEFAULT_FROM_EMAIL, [settings.CONTACT_EMAIL], fail_silently=False)
+            enqueue_mail(subject, email_message, settings.DEFAULT_FROM_EMAIL, [settings.CONTACT_EMAIL])
             return JsonResponse({'success': True, 'message': 'Message sent successfully!'})
         except Exception as e:
             return JsonResponse({'success': False, 'message': f'Failed to send message: {str(e)}'})
     return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
 @csrf_exempt
+@rate_limit('otp', settings.OTP_RATE_LIMIT)
 def forgot_password(request):
     if request.method == 'POST':
         email = request.POST.get('email')
         try:
             user = User.objects.get(email=email)
             user_data = {'email': email, 'user_id': user.id}
-            OTP.objects.filter(user_data__email=email, purpose='password_reset').delete()
+            OTP.objects.filter(email=email, purpose='password_reset').delete()
             otp = OTP.generate_otp(user_data, purpose='password_reset')
-            send_mail('Password Reset Verification Code', f'Your OTP code for password reset is: {otp.code}. It will expire in 10 minutes.', settings.DEFAULT_FROM_EMAIL, [email], fail_silently=False)
+            enqueue_mail('Password Reset Verification Code', f'Your OTP code for password reset is: {otp.code}. It will expire in 10 minutes.', settings.DEFAULT_FROM_EMAIL, [email])
             request.session['reset_email'] = email
             request.session.set_expiry(600)
             return redirect('/reset-password-otp/')
@@ -284,7 +541,7 @@ def reset_password_otp(request):
     if request.method == 'POST':
         otp_code = request.POST.get('otp_code')
         try:
-            otp = OTP.objects.get(user_data__email=email, code=otp_code, purpose='password_reset', is_used=False)
+            otp = OTP.objects.get(email=email, code=otp_code, purpose='password_reset', is_used=False)
             if otp.is_valid():
                 otp.is_used = True
                 otp.save()
@@ -310,6 +567,7 @@ def reset_password(request):
             user = User.objects.get(email=email)
             user.set_password(new_password)
             user.save()
+            invalidate_user(user.id)
             user = authenticate(username=user.username, password=new_password)
             if user:
                 login(request, user)
@@ -321,15 +579,16 @@ def reset_password(request):
     return render(request, 'chat/reset_password.html')
 
 @csrf_exempt
+@rate_limit('otp', settings.OTP_RATE_LIMIT)
 def resend_otp_password(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
             email = data.get('email')
             purpose = data.get('purpose', 'password_reset')
-            OTP.objects.filter(user_data__email=email, purpose=purpose, is_used=False).delete()
+            OTP.objects.filter(email=email, purpose=purpose, is_used=False).delete()
             otp = OTP.generate_otp({'email': email}, purpose=purpose)
-            send_mail('Your ChatBot Verification Code', f'Your new OTP code is: {otp.code}. It will expire in 10 minutes.', settings.DEFAULT_FROM_EMAIL, [email], fail_silently=False)
+            enqueue_mail('Your ChatBot Verification Code', f'Your new OTP code is: {otp.code}. It will expire in 10 minutes.', settings.DEFAULT_FROM_EMAIL, [email])
             return JsonResponse({'success': True})
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
@@ -0,0 +1,95 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import caches
+
+
+def normalize_city(city):
+    return ' '.join(city.lower().split())
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class WeatherCache:
+    """Caches weather lookups by normalized city in a Django cache.
+
+    ``fetch(city)`` returns the report text, or None when the city is
+    unknown; unknown cities are remembered for ``negative_ttl`` seconds.
+    Exceptions from ``fetch`` are never cached. Concurrent misses for the
+    same city share one upstream call: threads in this process wait on the
+    first caller, and other workers wait on a short-lived lock key in the
+    shared cache.
+    """
+
+    def __init__(self, fetch, ttl=600, negative_ttl=60, cache_alias='default', lock_timeout=10.0, poll_interval=0.05):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache_alias = cache_alias
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def key(self, city):
+        return 'weather:' + hashlib.sha1(normalize_city(city).encode()).hexdigest()
+
+    def get(self, city):
+        return self._get(self.key(city), city)[1]
+
+    def _get(self, key, city):
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats['hits'] += 1
+            return cached
+        self.stats['misses'] += 1
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+        if not leader:
+            if call.done.wait(self.lock_timeout) and call.error is None:
+                return call.value
+            return self._load(key, city)
+        try:
+            call.value = self._load(key, city)
+            return call.value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.done.set()
+
+    def _load(self, key, city):
+        lock_key = key + ':lock'
+        acquired = self.cache.add(lock_key, 1, self.lock_timeout)
+        if not acquired:
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
+        try:
+            text = self.fetch(city)
+            result = (text is not None, text)
+            self.cache.set(key, result, self.ttl if text is not None else self.negative_ttl)
+            return result
+        finally:
+            if acquired:
+                self.cache.delete(lock_key)
@@ -0,0 +1,307 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections
+from django.utils import timezone
+
+from .models import AccountDeletion, ChatMessage
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+def lock_file(file):
+    """Take a non-blocking exclusive lock on ``file``; False if another process holds it."""
+    try:
+        if fcntl:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def dump_record(record):
+    return json.dumps({**record, 'timestamp': record['timestamp'].isoformat()}) + '\n'
+
+
+def read_spool(path):
+    records = []
+    try:
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A crash mid-append leaves a torn last line.
+                    continue
+                record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+                records.append(record)
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def drop_deleted_accounts(records):
+    """Drop records buffered before their account was deleted.
+
+    Deleting an account only clears the buffer of the process that served
+    the request; rows in other workers' spools, or replayed from a crashed
+    one, are caught here by the AccountDeletion job's request time.
+    """
+    deleted = dict(
+        AccountDeletion.objects.filter(user_id__in={record['user_id'] for record in records}).values_list('user_id', 'requested_at')
+    )
+    return [record for record in records if record['user_id'] not in deleted or record['timestamp'] > deleted[record['user_id']]]
+
+
+def insert_messages(records):
+    records = drop_deleted_accounts(records)
+    if not records:
+        return 0
+    objects = [
+        ChatMessage(
+            user_id=record['user_id'],
+            conversation_id=record['conversation_id'],
+            message=record['message'],
+            response=record['response'],
+            timestamp=record['timestamp'],
+        )
+        for record in records
+    ]
+    try:
+        ChatMessage.objects.bulk_create(objects)
+    except IntegrityError:
+        # A user or conversation deleted while its rows sat in the buffer
+        # fails the whole batch; retry row by row and drop the orphans.
+        saved = 0
+        for chat_message in objects:
+            try:
+                chat_message.save()
+                saved += 1
+            except IntegrityError:
+                logger.warning('Dropping buffered chat message for missing user %s', chat_message.user_id)
+        return saved
+    return len(objects)
+
+
+def replay_messages(records):
+    """Insert spooled records that are not already in the table.
+
+    A process can die between the bulk insert and truncating its spool, so
+    rows are matched on (user, timestamp) before being written again.
+    """
+    if not records:
+        return 0
+    stored = set(
+        ChatMessage.objects.filter(
+            user_id__in={record['user_id'] for record in records},
+            timestamp__range=(min(record['timestamp'] for record in records), max(record['timestamp'] for record in records)),
+        ).values_list('user_id', 'timestamp')
+    )
+    missing = [record for record in records if (record['user_id'], record['timestamp']) not in stored]
+    return insert_messages(missing)
+
+
+class ChatMessageBuffer:
+    """Write-behind buffer for ChatMessage rows.
+
+    ``add()`` appends the row to a per-process spool file and returns; a
+    daemon thread bulk-inserts buffered rows once ``max_batch`` have piled
+    up or every ``flush_interval`` seconds, and ``close()`` flushes at exit.
+    Each process holds a lock on its spool for its lifetime, so a spool
+    whose lock can be taken belongs to a dead process and is replayed.
+    """
+
+    def __init__(self, spool_dir, max_batch=100, flush_interval=1.0, fsync=False):
+        self.spool_dir = Path(spool_dir)
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._pending = []
+        self._flushing = []
+        self._retry = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._name = None
+        self._spool = None
+        self._lock_file = None
+
+    @property
+    def spool_path(self):
+        return self.spool_dir / f'{self._name}.jsonl'
+
+    def start(self):
+        # Compared against the pid so a buffer imported before a fork
+        # (gunicorn --preload) gets its own spool and thread in each worker.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            self._name = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+            self._lock_file = open(self.spool_dir / f'{self._name}.lock', 'w')
+            lock_file(self._lock_file)
+            self._spool = open(self.spool_path, 'a', encoding='utf-8')
+            self._pending = []
+            self._flushing = []
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='chat-write-behind', daemon=True).start()
+            atexit.register(self.close)
+
+    def add(self, user_id, conversation_id, message, response):
+        self.start()
+        record = {
+            'user_id': user_id,
+            'conversation_id': conversation_id,
+            'message': message,
+            'response': response,
+            'timestamp': timezone.now(),
+        }
+        with self._lock:
+            self._spool.write(dump_record(record))
+            self._spool.flush()
+            if self.fsync:
+                os.fsync(self._spool.fileno())
+            self._pending.append(record)
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+        return record
+
+    def pending_for(self, user_id):
+        """Rows for ``user_id`` not yet visible in the database, oldest first.
+
+        Other processes' spools in ``spool_dir`` are read too, so a request
+        served by another worker on this host still sees them. A spool can
+        briefly hold rows that were already inserted; callers dedupe.
+        """
+        with self._lock:
+            records = [record for record in self._flushing + self._pending if record['user_id'] == user_id]
+        for spool_path in self.spool_dir.glob('*.jsonl'):
+            if spool_path.stem != self._name:
+                records += [record for record in read_spool(spool_path) if record['user_id'] == user_id]
+        return sorted(records, key=lambda record: record['timestamp'])
+
+    def discard(self, user_id):
+        """Forget ``user_id``'s buffered rows here and in this process's spool."""
+        with self._lock:
+            self._pending = [record for record in self._pending if record['user_id'] != user_id]
+            self._flushing = [record for record in self._flushing if record['user_id'] != user_id]
+            if self._pid == os.getpid():
+                # A batch being flushed stays in the spool until it is stored.
+                self._rewrite_spool(self._flushing + self._pending)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._flushing = batch
+            if not batch:
+                return 0
+            try:
+                # A failed flush may have inserted part of its batch (the
+                # row-by-row fallback, or an error after the bulk insert), so
+                # the retry skips rows that are already stored.
+                (replay_messages if self._retry else insert_messages)(batch)
+            except Exception:
+                with self._lock:
+                    self._pending = batch + self._pending
+                    self._flushing = []
+                self._retry = True
+                raise
+            self._retry = False
+            with self._lock:
+                self._flushing = []
+                # Rows added while the batch was being written stay in the spool.
+                self._rewrite_spool(self._pending)
+            return len(batch)
+
+    def _rewrite_spool(self, records):
+        self._spool.close()
+        temp_path = self.spool_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.writelines(dump_record(record) for record in records)
+        os.replace(temp_path, self.spool_path)
+        self._spool = open(self.spool_path, 'a', encoding='utf-8')
+
+    def recover(self):
+        replayed = 0
+        for lock_path in self.spool_dir.glob('*.lock'):
+            if lock_path.stem == self._name:
+                continue
+            with open(lock_path, 'a') as file:
+                if not lock_file(file):
+                    continue
+                spool_path = lock_path.with_suffix('.jsonl')
+                replayed += replay_messages(read_spool(spool_path))
+                spool_path.unlink(missing_ok=True)
+            lock_path.unlink(missing_ok=True)
+        if replayed:
+            logger.info('Replayed %d chat messages from orphaned spools', replayed)
+        return replayed
+
+    def _run(self):
+        try:
+            self.recover()
+        except Exception:
+            logger.exception('Could not replay orphaned chat spools')
+        finally:
+            close_old_connections()
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Write-behind flush failed; retrying on the next interval')
+            finally:
+                close_old_connections()
+
+    def close(self):
+        if self._pid != os.getpid():
+            return
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Could not flush buffered chat messages; they stay in %s', self.spool_path)
+            return
+        with self._lock:
+            if self._pending:
+                return
+            self._spool.close()
+            self._lock_file.close()
+            self.spool_path.unlink(missing_ok=True)
+            (self.spool_dir / f'{self._name}.lock').unlink(missing_ok=True)
+            self._pid = None
+
+
+chat_buffer = ChatMessageBuffer(
+    settings.CHAT_SPOOL_DIR,
+    settings.CHAT_FLUSH_BATCH_SIZE,
+    settings.CHAT_FLUSH_INTERVAL,
+    settings.CHAT_SPOOL_FSYNC,
+)
+
+
+def save_chat_message(user, conversation, message, response):
+    if settings.CHAT_WRITE_BEHIND:
+        chat_buffer.add(user.id, conversation.id if conversation else None, message, response)
+    else:
+        ChatMessage.objects.create(user=user, conversation=conversation, message=message, response=response)
@@ -3,6 +3,11 @@ ASGI config for chat_bot project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The streaming chat endpoint (/api/stream/) only relays tokens as they
+arrive when served through this entry point, e.g.:
+
+    uvicorn chat_bot.asgi:application --host 0.0.0.0 --port $PORT
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -13,6 +13,95 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '*').split(',')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY', '')
 
+GEMINI_API_BASE = os.getenv('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com')
+OPENWEATHER_API_BASE = os.getenv('OPENWEATHER_API_BASE', 'http://api.openweathermap.org')
+
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 5))
+UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', 30))
+UPSTREAM_MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', 2))
+UPSTREAM_BACKOFF_FACTOR = float(os.getenv('UPSTREAM_BACKOFF_FACTOR', 0.5))
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', 20))
+UPSTREAM_BREAKER_THRESHOLD = int(os.getenv('UPSTREAM_BREAKER_THRESHOLD', 5))
+UPSTREAM_BREAKER_RESET_TIMEOUT = float(os.getenv('UPSTREAM_BREAKER_RESET_TIMEOUT', 30))
+GEMINI_STREAM_TIMEOUT = float(os.getenv('GEMINI_STREAM_TIMEOUT', 60))
+GEMINI_STREAM_MAX_CONNECTIONS = int(os.getenv('GEMINI_STREAM_MAX_CONNECTIONS', 1000))
+
+# Gemini models to try in order, each as "model" or "model@base_url". Once a request
+# has been running for the model's recent LLM_HEDGE_PERCENTILE latency (LLM_HEDGE_DELAY
+# until LLM_HEDGE_MIN_SAMPLES are seen), the next model is asked too and the first answer wins.
+LLM_PROVIDERS = [entry for entry in os.getenv('LLM_PROVIDERS', 'gemini-2.0-flash').split(',') if entry.strip()]
+LLM_HEDGE = os.getenv('LLM_HEDGE', 'True') == 'True'
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', 95))
+LLM_HEDGE_DELAY = float(os.getenv('LLM_HEDGE_DELAY', 2))
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', 0.25))
+LLM_HEDGE_MAX_DELAY = float(os.getenv('LLM_HEDGE_MAX_DELAY', 10))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', 20))
+LLM_LATENCY_WINDOW = int(os.getenv('LLM_LATENCY_WINDOW', 200))
+LLM_DEADLINE = float(os.getenv('LLM_DEADLINE', 45))
+# Threads for LLM calls; a losing hedge keeps its thread until its response arrives.
+LLM_MAX_WORKERS = int(os.getenv('LLM_MAX_WORKERS', 128))
+
+WEATHER_CACHE_TTL = int(os.getenv('WEATHER_CACHE_TTL', 600))
+WEATHER_CACHE_NEGATIVE_TTL = int(os.getenv('WEATHER_CACHE_NEGATIVE_TTL', 60))
+
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', 86400))
+# Cosine similarity (0-1) above which a past answer is reused; unset disables the similarity tier.
+LLM_SIMILARITY_THRESHOLD = float(os.getenv('LLM_SIMILARITY_THRESHOLD') or 0) or None
+LLM_SIMILARITY_MAX_ENTRIES = int(os.getenv('LLM_SIMILARITY_MAX_ENTRIES', 2000))
+
+CONTEXT_MAX_TURNS = int(os.getenv('CONTEXT_MAX_TURNS', 10))
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 3000))
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv('CONTEXT_SUMMARY_MAX_TOKENS', 400))
+
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv('CHAT_ARCHIVE_AFTER_DAYS', 90))
+CHAT_EXPORT_CHUNK_SIZE = int(os.getenv('CHAT_EXPORT_CHUNK_SIZE', 1000))
+
+# Chat answers of CHAT_COMPRESS_MIN_LENGTH bytes or more are stored deflated, with the newest
+# dictionary from train_compression_dictionary when CHAT_COMPRESS_DICTIONARY is on.
+CHAT_COMPRESS_MIN_LENGTH = int(os.getenv('CHAT_COMPRESS_MIN_LENGTH', 200))
+CHAT_COMPRESS_LEVEL = int(os.getenv('CHAT_COMPRESS_LEVEL', 6))
+CHAT_COMPRESS_DICTIONARY = os.getenv('CHAT_COMPRESS_DICTIONARY', 'True') == 'True'
+
+# Chat messages are spooled to a local file and bulk-inserted from a background
+# thread; spools left by a crashed process are replayed on the next start.
+# History and exports merge in every spool under CHAT_SPOOL_DIR, so workers on
+# one host see each other's unflushed messages. Workers on other hosts do not:
+# behind a load balancer without sticky sessions, a history request can miss
+# messages sent in the last CHAT_FLUSH_INTERVAL seconds, so set
+# CHAT_WRITE_BEHIND=False (or share CHAT_SPOOL_DIR) there.
+CHAT_WRITE_BEHIND = os.getenv('CHAT_WRITE_BEHIND', 'True') == 'True'
+CHAT_SPOOL_DIR = BASE_DIR / os.getenv('CHAT_SPOOL_DIR', 'chat_spool')
+CHAT_FLUSH_BATCH_SIZE = int(os.getenv('CHAT_FLUSH_BATCH_SIZE', 100))
+CHAT_FLUSH_INTERVAL = float(os.getenv('CHAT_FLUSH_INTERVAL', 1))
+CHAT_SPOOL_FSYNC = os.getenv('CHAT_SPOOL_FSYNC', 'False') == 'True'
+
+# Token-bucket limits as "<requests>/<period>", period one of s, m, h, d (e.g. 5/10m).
+# Buckets live in the default cache, so with the LocMem default each worker
+# process counts separately; point CACHE_BACKEND at Redis to share them.
+# Logged-in users are limited per account, anonymous requests (OTP, signup)
+# per client IP. Behind a reverse proxy every request comes from the proxy's
+# address, so X-Forwarded-For is trusted there: by default on Render (which
+# sets RENDER), with RATELIMIT_PROXY_COUNT proxies appending to it.
+RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', 'True') == 'True'
+RATELIMIT_TRUST_FORWARDED_FOR = os.getenv('RATELIMIT_TRUST_FORWARDED_FOR', str(bool(os.getenv('RENDER')))) == 'True'
+RATELIMIT_PROXY_COUNT = int(os.getenv('RATELIMIT_PROXY_COUNT', 1))
+CHAT_RATE_LIMIT = os.getenv('CHAT_RATE_LIMIT', '20/m')
+OTP_RATE_LIMIT = os.getenv('OTP_RATE_LIMIT', '5/10m')
+CHAT_EXPORT_RATE_LIMIT = os.getenv('CHAT_EXPORT_RATE_LIMIT', '5/h')
+GEMINI_MAX_IN_FLIGHT = int(os.getenv('GEMINI_MAX_IN_FLIGHT', 32))
+GEMINI_MAX_QUEUE = int(os.getenv('GEMINI_MAX_QUEUE', 32))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv('GEMINI_QUEUE_TIMEOUT', 2))
+
+# /metrics answers staff users and scrapers sending "Authorization: Bearer <METRICS_TOKEN>";
+# METRICS_PUBLIC=True opens it to everyone. Metrics are kept per worker process
+# and reset on restart, so a scrape covers only the worker that answered it.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_PUBLIC = os.getenv('METRICS_PUBLIC', 'False') == 'True'
+METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', 'False') == 'True'
+
+CUSTOM_RESPONSES_FILE = BASE_DIR / os.getenv('CUSTOM_RESPONSES_FILE', 'responses.txt')
+CUSTOM_RESPONSES_RELOAD_INTERVAL = float(os.getenv('CUSTOM_RESPONSES_RELOAD_INTERVAL', 5))
+
 EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
 EMAIL_PORT = int(os.getenv('EMAIL_PORT', 587))
@@ -22,6 +111,25 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', EMAIL_HOST_USER)
 CONTACT_EMAIL = os.getenv('CONTACT_EMAIL', EMAIL_HOST_USER)
 
+# 'thread' drains the outbox from daemon threads in each web process;
+# 'command' leaves it to `python manage.py send_queued_mail --loop`.
+MAIL_QUEUE_MODE = os.getenv('MAIL_QUEUE_MODE', 'thread')
+MAIL_QUEUE_WORKERS = int(os.getenv('MAIL_QUEUE_WORKERS', 2))
+MAIL_QUEUE_BATCH_SIZE = int(os.getenv('MAIL_QUEUE_BATCH_SIZE', 50))
+MAIL_QUEUE_POLL_INTERVAL = float(os.getenv('MAIL_QUEUE_POLL_INTERVAL', 5))
+MAIL_QUEUE_LEASE = int(os.getenv('MAIL_QUEUE_LEASE', 300))
+MAIL_QUEUE_MAX_ATTEMPTS = int(os.getenv('MAIL_QUEUE_MAX_ATTEMPTS', 5))
+MAIL_QUEUE_RETRY_DELAY = int(os.getenv('MAIL_QUEUE_RETRY_DELAY', 30))
+
+# Deleting an account deactivates it at once and purges its data in chunks in
+# the background; 'command' leaves that to `python manage.py purge_accounts --loop`.
+ACCOUNT_DELETION_MODE = os.getenv('ACCOUNT_DELETION_MODE', 'thread')
+ACCOUNT_DELETION_CHUNK_SIZE = int(os.getenv('ACCOUNT_DELETION_CHUNK_SIZE', 1000))
+ACCOUNT_DELETION_POLL_INTERVAL = float(os.getenv('ACCOUNT_DELETION_POLL_INTERVAL', 30))
+ACCOUNT_DELETION_LEASE = int(os.getenv('ACCOUNT_DELETION_LEASE', 300))
+ACCOUNT_DELETION_MAX_ATTEMPTS = int(os.getenv('ACCOUNT_DELETION_MAX_ATTEMPTS', 5))
+ACCOUNT_DELETION_RETRY_DELAY = int(os.getenv('ACCOUNT_DELETION_RETRY_DELAY', 60))
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -33,12 +141,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chat.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'chat.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -63,25 +172,97 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'chat_bot.wsgi.application'
 
-cert_path = '/tmp/ca.pem'
-with open(cert_path, 'w') as f:
-    f.write(os.environ['DB_CA_CERT'].replace('\\n', '\n'))
+def write_ca_cert(path, cert):
+    # Workers import settings on every boot; skip the write when the file is
+    # already current and replace it atomically when it is not.
+    try:
+        with open(path) as f:
+            if f.read() == cert:
+                return
+    except FileNotFoundError:
+        pass
+    with open(f'{path}.{os.getpid()}', 'w') as f:
+        f.write(cert)
+    os.replace(f'{path}.{os.getpid()}', path)
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.mysql',
-        'NAME': os.getenv('DB_NAME'),
-        'USER': os.getenv('DB_USER'),
-        'PASSWORD': os.getenv('DB_PASSWORD'),
-        'HOST': os.getenv('DB_HOST', 'localhost'),
-        'PORT': os.getenv('DB_PORT', '3306'),
-        'OPTIONS': {
-            'ssl': {
-                'ca': cert_path,
-            }
+# Without DB_NAME the app runs on a local SQLite file, for development and tests.
+if os.getenv('DB_NAME'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.mysql',
+            'NAME': os.getenv('DB_NAME'),
+            'USER': os.getenv('DB_USER'),
+            'PASSWORD': os.getenv('DB_PASSWORD'),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '3306'),
+            'OPTIONS': {},
         }
     }
+    if os.getenv('DB_CA_CERT'):
+        cert_path = os.getenv('DB_CA_CERT_PATH', '/tmp/ca.pem')
+        write_ca_cert(cert_path, os.environ['DB_CA_CERT'].replace('\\n', '\n'))
+        DATABASES['default']['OPTIONS']['ssl'] = {'ca': cert_path}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / os.getenv('SQLITE_PATH', 'db.sqlite3'),
+        }
+    }
+
+# Seconds to keep a connection open across requests (0 closes it after each
+# request, empty keeps it forever); health checks drop connections the
+# server has closed before they are reused.
+DB_CONN_MAX_AGE = os.getenv('DB_CONN_MAX_AGE', '60')
+DATABASES['default']['CONN_MAX_AGE'] = int(DB_CONN_MAX_AGE) if DB_CONN_MAX_AGE else None
+DATABASES['default']['CONN_HEALTH_CHECKS'] = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'chat-bot'),
+    }
 }
+if 'redis' not in CACHES['default']['BACKEND']:
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000))}
+
+# True when the default cache is shared by every worker (Redis or Memcached).
+SHARED_CACHE = any(name in CACHES['default']['BACKEND'] for name in ('redis', 'memcached'))
+
+# Session storage: 'db' (Django's default), 'cached_db' (read through
+# SESSION_CACHE_ALIAS, written through to the database) or 'signed_cookies'
+# (no server-side lookup at all). cached_db is the default only with a
+# shared cache: the per-process 'sessions' cache would let a logout handled
+# by one worker go unnoticed by the others for up to SESSION_CACHE_TTL seconds.
+SESSION_MODE = os.getenv('SESSION_MODE', 'cached_db' if SHARED_CACHE else 'db')
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSION_MODE]
+SESSION_CACHE_ALIAS = os.getenv('SESSION_CACHE_ALIAS', 'default' if SHARED_CACHE else 'sessions')
+CACHES['sessions'] = {
+    'BACKEND': 'chat.cache_backends.BoundedLocMemCache',
+    'LOCATION': 'sessions',
+    'OPTIONS': {
+        'MAX_ENTRIES': int(os.getenv('SESSION_CACHE_MAX_ENTRIES', 10000)),
+        'MAX_TIMEOUT': int(os.getenv('SESSION_CACHE_TTL', 60)),
+    },
+}
+
+# Authenticated users are kept in a per-process cache for USER_CACHE_TTL
+# seconds (0 disables it). Saving a user or logging out evicts them; with a
+# shared cache the eviction reaches every worker through a per-user version
+# key, so the cache is on by default only then.
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 60 if SHARED_CACHE else 0))
+USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', 10000))
+
+# Seconds a conversation's recent turns stay cached. A per-process cache
+# would hand a worker its own stale copy of a conversation another worker
+# has moved on (and overwrite the newer summary), so without a shared cache
+# the window is read from the database, plus unflushed turns, on every turn.
+CONTEXT_CACHE_TTL = int(os.getenv('CONTEXT_CACHE_TTL', 3600 if SHARED_CACHE else 0))
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -99,7 +280,17 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# STATICFILES_STORAGE is no longer read by Django 5.1+; STORAGES is.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
+
+# Landing and chat pages are rendered once per variant and deploy, then served from
+# memory with ETag/Last-Modified and pre-compressed bodies. Off by default under DEBUG
+# so template edits show up.
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', str(not DEBUG)) == 'True'
+PAGE_CACHE_MAX_ENTRIES = int(os.getenv('PAGE_CACHE_MAX_ENTRIES', 1000))
 
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/login/'